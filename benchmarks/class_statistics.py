@@ -0,0 +1,57 @@
+"""
+Compare class_statistics with per-class torch.cov, for growing dimensions.
+
+Usage: python benchmarks/class_statistics.py --n-points 20000 --n-dim 52 400 1500
+"""
+
+import argparse
+import time
+
+import torch
+
+from amatorch import inference
+
+
+def timed(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def per_class_covariances(points, labels, n_classes):
+    return torch.stack([torch.cov(points[labels == c].T) for c in range(n_classes)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-points", type=int, default=20_000)
+    parser.add_argument("--n-classes", type=int, default=20)
+    parser.add_argument("--n-dim", type=int, nargs="+", default=[52, 400, 1500])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    labels = torch.arange(args.n_points) % args.n_classes
+    for n_dim in args.n_dim:
+        points = torch.randn(args.n_points, n_dim)
+        reference_time, reference = timed(
+            lambda points=points: per_class_covariances(points, labels, args.n_classes),
+            args.repeats,
+        )
+        statistics_time, statistics = timed(
+            lambda points=points: inference.class_statistics(points, labels),
+            args.repeats,
+        )
+        assert torch.allclose(statistics["covariances"], reference, atol=1e-4)
+        print(
+            f"n_dim={n_dim}: class_statistics {statistics_time:.3f}s, "
+            f"per-class torch.cov {reference_time:.3f}s "
+            f"(ratio {statistics_time / reference_time:.2f})"
+        )
+
+
+if __name__ == "__main__":
+    main()
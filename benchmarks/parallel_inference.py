@@ -0,0 +1,74 @@
+"""
+Compare serial and parallel evaluation of an AMAGauss model.
+
+Usage: python benchmarks/parallel_inference.py --n-stimuli 1000000 --n-workers 8
+"""
+
+import argparse
+import time
+
+import torch
+
+from amatorch import parallel
+from amatorch.models import AMAGauss
+
+
+def make_stimuli(n_stimuli, n_classes, n_channels, n_dim):
+    labels = torch.arange(n_stimuli) % n_classes
+    shifts = torch.linspace(-1, 1, n_dim) * labels[:, None, None] / n_classes
+    stimuli = torch.randn(n_stimuli, n_channels, n_dim) + shifts
+    return stimuli, labels
+
+
+def timed(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-stimuli", type=int, default=500_000)
+    parser.add_argument("--n-classes", type=int, default=50)
+    parser.add_argument("--n-channels", type=int, default=2)
+    parser.add_argument("--n-dim", type=int, default=26)
+    parser.add_argument("--n-filters", type=int, default=8)
+    parser.add_argument("--n-workers", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    stimuli, labels = make_stimuli(
+        args.n_stimuli, args.n_classes, args.n_channels, args.n_dim
+    )
+    model = AMAGauss(stimuli, labels, n_filters=args.n_filters, response_noise=0.01)
+    outputs = ("posteriors", "estimates")
+
+    serial_time, serial = timed(
+        lambda: model.batched_inference(stimuli, outputs=outputs), args.repeats
+    )
+    print(f"serial ({torch.get_num_threads()} threads): {serial_time:.3f}s")
+
+    for backend in ("thread", "process"):
+        backend_time, result = timed(
+            lambda backend=backend: parallel.parallel_inference(
+                model,
+                stimuli,
+                outputs=outputs,
+                n_workers=args.n_workers,
+                backend=backend,
+            ),
+            args.repeats,
+        )
+        assert torch.equal(result["estimates"], serial["estimates"])
+        print(
+            f"{backend}: {backend_time:.3f}s "
+            f"(speedup {serial_time / backend_time:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
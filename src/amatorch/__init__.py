@@ -4,3 +4,4 @@ from . import datasets as datasets
 from . import models as models
 from . import normalization as normalization
 from . import optim as optim
+from . import parallel as parallel
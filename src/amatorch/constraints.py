@@ -24,13 +24,14 @@ class Sphere(nn.Module):
         Parameters
         ----------
         X : torch.Tensor
-            Input tensor in Euclidean space with shape (n_filters, n_channels, n_dim).
+            Input tensor in Euclidean space with shape
+            (..., n_filters, n_channels, n_dim).
 
         Returns
         -------
         torch.Tensor
             Normalized tensor lying on the sphere with shape
-            (n_filters, n_channels, n_dim).
+            (..., n_filters, n_channels, n_dim).
         """
         return normalization.unit_norm(X)
 
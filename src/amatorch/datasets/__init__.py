@@ -1,8 +1,28 @@
 from importlib import resources
 
-from .load import load_data, load_filters
+from .load import convert_csv_to_npy, load_data, load_filters
+from .registry import (
+    clear_cache,
+    load_dataset,
+    load_dataset_filters,
+    register_dataset,
+    registered_datasets,
+    set_cache_dir,
+)
 
-__all__ = ["disparity_data", "disparity_filters"]
+__all__ = [
+    "disparity_data",
+    "disparity_filters",
+    "load_data",
+    "load_filters",
+    "convert_csv_to_npy",
+    "register_dataset",
+    "registered_datasets",
+    "load_dataset",
+    "load_dataset_filters",
+    "set_cache_dir",
+    "clear_cache",
+]
 
 
 def __dir__():
@@ -12,11 +32,16 @@ def __dir__():
 # Reference the resources inside the `data` directory of the package
 FILES = resources.files(__name__)
 
+register_dataset("disparity", data_dir=FILES / "disparity", stimulus_shape=(2, 26))
+
 
 def disparity_data():
     """
     Load data from the 'disparity' subdirectory.
 
+    The data are read on the first call and reused afterwards
+    (see `load_dataset`).
+
     Returns
     -------
     dict
@@ -24,27 +49,20 @@ def disparity_data():
         The 'stimuli' are reshaped to (n_samples, n_channels, n_pixels),
         where `n_channels=2` and `n_pixels=26`.
     """
-    data_dir = FILES / "disparity"
-    data = load_data(data_dir=data_dir)
-    n_channels = 2
-    n_pixels = 26
-    data["stimuli"] = data["stimuli"].reshape(-1, n_channels, n_pixels)
-    return data
+    return load_dataset("disparity")
 
 
 def disparity_filters():
     """
     Load filters from the 'disparity' subdirectory.
 
+    The filters are read on the first call and reused afterwards
+    (see `load_dataset_filters`).
+
     Returns
     -------
     torch.Tensor
         A tensor of shape (n_filters, n_channels, n_pixels) containing the filters,
         where `n_channels=2` and `n_pixels=26`.
     """
-    data_dir = FILES / "disparity"
-    filters = load_filters(data_dir=data_dir)
-    n_channels = 2
-    n_pixels = 26
-    filters = filters.reshape(-1, n_channels, n_pixels)
-    return filters
+    return load_dataset_filters("disparity")
@@ -1,29 +1,101 @@
+from pathlib import Path
+
 import numpy as np
 import torch
 
+# Data type of each dataset file
+FILE_DTYPES = {
+    "stimuli": np.float32,
+    "labels": np.int64,
+    "label_values": np.float32,
+    "filters": np.float32,
+}
+
 
 def load_data(data_dir="disparity"):
-    """Load .csv files containing stimuli, labels, and label values."""
-    stimuli = torch.as_tensor(
-        np.loadtxt(data_dir / "stimuli.csv", delimiter=",", dtype=np.float32)
-    )
-
-    labels = torch.as_tensor(
-        np.loadtxt(data_dir / "labels.csv", delimiter=",", dtype=int)
-    )
+    """Load stimuli, labels, and label values from .npy or .csv files."""
+    stimuli = load_array(data_dir, "stimuli")
+    labels = load_array(data_dir, "labels")
     labels = labels - 1  # make 0-indexed
-
-    values = torch.as_tensor(
-        np.loadtxt(data_dir / "label_values.csv", delimiter=",", dtype=np.float32)
-    )
+    values = load_array(data_dir, "label_values")
 
     return {"stimuli": stimuli, "labels": labels, "values": values}
 
 
 def load_filters(data_dir="disparity"):
-    """Load and format pretrained filters in .csv file."""
-    filters = torch.as_tensor(
-        np.loadtxt(data_dir / "filters.csv", delimiter=",", dtype=np.float32)
-    )
+    """Load and format pretrained filters in .npy or .csv file."""
+    filters = load_array(data_dir, "filters")
 
     return filters
+
+
+def load_array(data_dir, name, dtype=None):
+    """
+    Load a dataset file as a tensor.
+
+    If a binary `{name}.npy` file exists it is memory-mapped and wrapped
+    without copying, otherwise `{name}.csv` is parsed.
+
+    Parameters
+    ----------
+    data_dir : pathlib.Path or importlib.resources.abc.Traversable
+        Directory containing the file.
+    name : str
+        Name of the file, without extension.
+    dtype : numpy.dtype, optional
+        Data type used when parsing the .csv file, by default the type in
+        `FILE_DTYPES`, or float32 for other files.
+
+    Returns
+    -------
+    torch.Tensor
+        Tensor with the contents of the file.
+    """
+    npy_file = data_dir / f"{name}.npy"
+    if npy_file.is_file():
+        # Copy-on-write mapping, so that the tensor is writable
+        return torch.from_numpy(np.load(npy_file, mmap_mode="c"))
+    if dtype is None:
+        dtype = FILE_DTYPES.get(name, np.float32)
+    return torch.as_tensor(_load_csv(data_dir / f"{name}.csv", dtype))
+
+
+def convert_csv_to_npy(data_dir, output_dir=None):
+    """
+    Convert the .csv files of a dataset to .npy files.
+
+    After conversion, `load_data` and `load_filters` memory-map the .npy
+    files instead of parsing the .csv files.
+
+    Parameters
+    ----------
+    data_dir : str or os.PathLike
+        Directory containing the .csv files.
+    output_dir : str or os.PathLike, optional
+        Directory in which to write the .npy files, by default `data_dir`.
+
+    Returns
+    -------
+    list of pathlib.Path
+        The .npy files written.
+    """
+    data_dir = Path(data_dir)
+    output_dir = data_dir if output_dir is None else Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    written = []
+    for name, dtype in FILE_DTYPES.items():
+        csv_file = data_dir / f"{name}.csv"
+        if not csv_file.is_file():
+            continue
+        npy_file = output_dir / f"{name}.npy"
+        np.save(npy_file, _load_csv(csv_file, dtype))
+        written.append(npy_file)
+    return written
+
+
+def _load_csv(csv_file, dtype):
+    if np.issubdtype(dtype, np.integer):
+        # Integers are stored with decimals (e.g. 1.000000), so parse as float
+        return np.loadtxt(csv_file, delimiter=",", dtype=np.float64).astype(dtype)
+    return np.loadtxt(csv_file, delimiter=",", dtype=dtype)
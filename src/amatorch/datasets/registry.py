@@ -0,0 +1,265 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from .load import FILE_DTYPES, _load_csv, load_array
+
+__all__ = [
+    "register_dataset",
+    "registered_datasets",
+    "load_dataset",
+    "load_dataset_filters",
+    "set_cache_dir",
+    "clear_cache",
+]
+
+
+def __dir__():
+    return __all__
+
+
+# Maximum number of datasets (or filter sets) kept in memory
+CACHE_SIZE = 8
+
+# Default file names of each part of a dataset
+DEFAULT_FILES = {
+    "stimuli": "stimuli",
+    "labels": "labels",
+    "values": "label_values",
+    "filters": "filters",
+}
+
+_REGISTRY = {}
+_cache_dir = os.environ.get("AMATORCH_CACHE_DIR")
+
+# Sources of the datasets and filters (.npy file paths, or parsed .csv files
+# kept in memory), by (kind, name), least recently used first
+_MEMORY_CACHE = OrderedDict()
+
+
+def register_dataset(
+    name, data_dir, stimulus_shape, files=None, dtype=np.float32, overwrite=False
+):
+    """
+    Register a dataset so that it can be loaded with `load_dataset`.
+
+    Nothing is read until the dataset is first loaded.
+
+    Parameters
+    ----------
+    name : str
+        Name of the dataset.
+    data_dir : str, os.PathLike or importlib.resources.abc.Traversable
+        Directory containing the dataset files. Each file is read from
+        `{file}.npy` if it exists, or from `{file}.csv` otherwise.
+    stimulus_shape : tuple of int
+        Shape (n_channels, n_dim) of each stimulus (and filter).
+    files : dict, optional
+        File names (without extension) of the 'stimuli', 'labels',
+        'values' and 'filters' of the dataset, by default `DEFAULT_FILES`.
+    dtype : numpy.dtype, optional
+        Data type of the stimuli, values and filters, by default float32.
+    overwrite : bool, optional
+        Whether to replace a dataset already registered with the same name,
+        by default False.
+    """
+    if name in _REGISTRY and not overwrite:
+        raise ValueError(f"Dataset '{name}' is already registered.")
+    if isinstance(data_dir, (str, os.PathLike)):
+        data_dir = Path(data_dir)
+    _REGISTRY[name] = {
+        "data_dir": data_dir,
+        "stimulus_shape": tuple(stimulus_shape),
+        "files": {**DEFAULT_FILES, **(files or {})},
+        "dtypes": {
+            "stimuli": dtype,
+            "labels": FILE_DTYPES["labels"],
+            "values": dtype,
+            "filters": dtype,
+        },
+    }
+    clear_cache(name)
+
+
+def registered_datasets():
+    """
+    Return the names of the registered datasets.
+
+    Returns
+    -------
+    list of str
+        Names of the registered datasets.
+    """
+    return list(_REGISTRY)
+
+
+def load_dataset(name):
+    """
+    Load a registered dataset.
+
+    The dataset is read on the first call and reused by the next ones.
+    Files stored as .npy (including the on-disk cache of parsed .csv
+    files) are memory-mapped copy-on-write at every call, without copying
+    them, and parsed .csv files are kept in memory and copied at every
+    call. Either way, the returned tensors can be modified in place
+    without affecting later loads.
+
+    Parameters
+    ----------
+    name : str
+        Name of the dataset.
+
+    Returns
+    -------
+    dict
+        A dictionary containing the loaded stimuli, labels, and values.
+        The 'stimuli' have shape (n_samples, n_channels, n_dim).
+    """
+    spec = _get_spec(name)
+    sources = _cached("dataset", name, _read_dataset)
+    stimuli = _open(sources["stimuli"]).reshape(-1, *spec["stimulus_shape"])
+    labels = _open(sources["labels"]) - 1  # make 0-indexed
+    values = _open(sources["values"])
+    return {"stimuli": stimuli, "labels": labels, "values": values}
+
+
+def load_dataset_filters(name):
+    """
+    Load the filters of a registered dataset.
+
+    The filters are read on the first call and reused by the next ones,
+    as in `load_dataset`, so the returned tensor can be modified in place
+    without affecting later loads.
+
+    Parameters
+    ----------
+    name : str
+        Name of the dataset.
+
+    Returns
+    -------
+    torch.Tensor
+        A tensor of shape (n_filters, n_channels, n_dim) containing the filters.
+    """
+    spec = _get_spec(name)
+    filters = _open(_cached("filters", name, _read_dataset_filters))
+    return filters.reshape(-1, *spec["stimulus_shape"])
+
+
+def set_cache_dir(cache_dir):
+    """
+    Set the directory of the on-disk cache of parsed .csv files.
+
+    Parsed .csv files are stored as .npy files named after a hash of the
+    source file, and memory-mapped on later loads. The initial value is
+    taken from the `AMATORCH_CACHE_DIR` environment variable.
+
+    Parameters
+    ----------
+    cache_dir : str or os.PathLike or None
+        Cache directory. If None, the on-disk cache is disabled.
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+    clear_cache()
+
+
+def clear_cache(name=None):
+    """
+    Drop the datasets kept in memory.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the dataset to drop, by default None (all the datasets).
+    """
+    if name is None:
+        _MEMORY_CACHE.clear()
+        return
+    for kind in ("dataset", "filters"):
+        _MEMORY_CACHE.pop((kind, name), None)
+
+
+def _cached(kind, name, load):
+    """Return `load(name)`, keeping the last `CACHE_SIZE` results in memory."""
+    key = (kind, name)
+    if key in _MEMORY_CACHE:
+        _MEMORY_CACHE.move_to_end(key)
+        return _MEMORY_CACHE[key]
+    value = load(name)
+    _MEMORY_CACHE[key] = value
+    if len(_MEMORY_CACHE) > CACHE_SIZE:
+        _MEMORY_CACHE.popitem(last=False)
+    return value
+
+
+def _read_dataset(name):
+    spec = _get_spec(name)
+    return {
+        key: _file_source(name, spec, key) for key in ("stimuli", "labels", "values")
+    }
+
+
+def _read_dataset_filters(name):
+    return _file_source(name, _get_spec(name), "filters")
+
+
+def _open(source):
+    """Tensor of a `_file_source`, not shared with other calls."""
+    if isinstance(source, torch.Tensor):
+        return source.clone()
+    # Copy-on-write mapping, so that the tensor is writable
+    return torch.from_numpy(np.load(source, mmap_mode="c"))
+
+
+def _get_spec(name):
+    if name not in _REGISTRY:
+        raise KeyError(
+            f"Dataset '{name}' is not registered. "
+            f"Registered datasets are {registered_datasets()}."
+        )
+    return _REGISTRY[name]
+
+
+def _file_source(dataset_name, spec, key):
+    """
+    Path of the .npy file of a part of a dataset, or its parsed contents
+    if it is only stored as a .csv file and the on-disk cache is disabled.
+    """
+    data_dir = spec["data_dir"]
+    file_name = spec["files"][key]
+    dtype = spec["dtypes"][key]
+    npy_file = data_dir / f"{file_name}.npy"
+    if npy_file.is_file():
+        return npy_file
+    if _cache_dir is None:
+        return load_array(data_dir, file_name, dtype=dtype)
+
+    csv_file = data_dir / f"{file_name}.csv"
+    cache_file = (
+        Path(_cache_dir) / dataset_name / f"{file_name}-{_file_hash(csv_file)}.npy"
+    )
+    if not cache_file.is_file():
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first, so that concurrent processes
+        # never read a partially written cache file
+        with tempfile.NamedTemporaryFile(
+            dir=cache_file.parent, suffix=".npy", delete=False
+        ) as temp_file:
+            np.save(temp_file, _load_csv(csv_file, dtype))
+        os.replace(temp_file.name, cache_file)
+    return cache_file
+
+
+def _file_hash(file, chunk_size=2**20):
+    """Short SHA-256 hex digest of the contents of `file`."""
+    digest = hashlib.sha256()
+    with file.open("rb") as stream:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
@@ -1,17 +1,54 @@
+import math
+
 import torch
 
-__all__ = ["gaussian_log_likelihoods", "class_statistics"]
+__all__ = [
+    "gaussian_log_likelihoods",
+    "gaussian_factors",
+    "factorized_gaussian_log_likelihoods",
+    "class_statistics",
+    "low_rank_class_statistics",
+    "low_rank_covariances",
+    "pooled_covariance",
+    "mixture_covariance",
+    "principal_components",
+    "covariance_principal_components",
+    "ClassStatisticsAccumulator",
+]
 
 
 def __dir__():
     return __all__
 
 
-def gaussian_log_likelihoods(points, means, covariances):
+LOG_LIKELIHOOD_METHODS = ("inverse", "cholesky", "quadratic")
+# Methods of `factorized_gaussian_log_likelihoods`, and of the models
+FACTORIZED_LOG_LIKELIHOOD_METHODS = ("cholesky", "quadratic")
+
+# Minimum budget for the number of elements of the zero-padded class points
+# of `class_statistics` (at least the number of elements of the points)
+_PADDED_CLASSES_CHUNK_ELEMENTS = 2**24
+
+# Maximum number of elements in the (n_classes, n_dim, n_points) whitened
+# distances of the "cholesky" log-likelihoods, when no chunk size is given
+_WHITENED_CHUNK_ELEMENTS = 2**24
+
+# Extra components computed by the randomized SVDs of
+# `low_rank_class_statistics` and `principal_components`, for accuracy
+# of the leading components
+_LOW_RANK_OVERSAMPLING = 10
+
+
+def gaussian_log_likelihoods(
+    points, means, covariances, method="inverse", chunk_size=None
+):
     """
     Compute the log-likelihood of each class assuming conditional
     Gaussian distributions.
 
+    All the inputs may have matching leading batch dimensions (e.g. one
+    set of classes per model), which are kept in the output.
+
     Parameters
     ----------
     points : torch.Tensor
@@ -20,37 +57,248 @@ def gaussian_log_likelihoods(points, means, covariances):
         Mean of each class with shape (n_classes, n_dim).
     covariances : torch.Tensor
         Covariance matrix of each class with shape (n_classes, n_dim, n_dim).
+    method : str, optional
+        How to evaluate the quadratic forms, by default "inverse".
+        - "inverse": explicit inverse of each covariance matrix.
+        - "cholesky": triangular solves against the Cholesky factors.
+        - "quadratic": expanded quadratic form x'Px - 2x'Pm + m'Pm computed
+            with matrix products, without (n_points, n_classes, n_dim)
+            intermediates.
+    chunk_size : int, optional
+        If given, the points are processed in chunks of at most this size
+        to bound peak memory, by default None.
 
     Returns
     -------
     torch.Tensor
         Log-likelihoods for each class with shape (n_points, n_classes).
     """
+    if method not in LOG_LIKELIHOOD_METHODS:
+        raise ValueError(
+            f"Unknown log-likelihood method '{method}'. "
+            f"Available methods are {LOG_LIKELIHOOD_METHODS}."
+        )
+    if method == "inverse":
+        precisions = covariances.inverse()
+        log_determinants = torch.logdet(covariances)
+        return _chunked(
+            lambda chunk: _inverse_log_likelihoods(
+                chunk, means, precisions, log_determinants
+            ),
+            points,
+            chunk_size,
+        )
+    factors = gaussian_factors(means, covariances)
+    return factorized_gaussian_log_likelihoods(
+        points, **factors, method=method, chunk_size=chunk_size
+    )
+
+
+def gaussian_factors(means, covariances):
+    """
+    Factorize the class-conditional Gaussians for repeated likelihood evaluation.
+
+    Parameters
+    ----------
+    means : torch.Tensor
+        Mean of each class with shape (n_classes, n_dim).
+    covariances : torch.Tensor
+        Covariance matrix of each class with shape (n_classes, n_dim, n_dim).
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+        - means: torch.Tensor of shape (n_classes, n_dim), the mean of each class.
+        - cholesky: torch.Tensor of shape (n_classes, n_dim, n_dim), the lower
+            Cholesky factor of each covariance matrix.
+        - log_determinants: torch.Tensor of shape (n_classes), the
+            log-determinant of each covariance matrix.
+    """
+    cholesky = torch.linalg.cholesky(covariances)
+    log_determinants = 2 * torch.sum(
+        torch.log(torch.diagonal(cholesky, dim1=-2, dim2=-1)), dim=-1
+    )
+    return {"means": means, "cholesky": cholesky, "log_determinants": log_determinants}
+
+
+def factorized_gaussian_log_likelihoods(
+    points, means, cholesky, log_determinants, method="cholesky", chunk_size=None
+):
+    """
+    Compute the log-likelihood of each class assuming conditional
+    Gaussian distributions, from the factorized covariances returned
+    by `gaussian_factors`.
+
+    All the inputs may have matching leading batch dimensions, as in
+    `gaussian_log_likelihoods`.
+
+    Parameters
+    ----------
+    points : torch.Tensor
+        Points at which to evaluate the log-likelihoods with shape (n_points, n_dim).
+    means : torch.Tensor
+        Mean of each class with shape (n_classes, n_dim).
+    cholesky : torch.Tensor
+        Lower Cholesky factor of the covariance matrix of each class with
+        shape (n_classes, n_dim, n_dim). If its shape is (1, n_dim, n_dim),
+        the covariance is shared by all classes and the points and means
+        are whitened once, so that the log-likelihoods reduce to a single
+        matrix product (linear discriminant).
+    log_determinants : torch.Tensor
+        Log-determinant of the covariance matrix of each class with
+        shape (n_classes), or (1) for a shared covariance.
+    method : str, optional
+        How to evaluate the quadratic forms, either "cholesky" (triangular
+        solves) or "quadratic" (expanded quadratic form), by default "cholesky".
+        See `gaussian_log_likelihoods`. Ignored for a shared covariance.
+    chunk_size : int, optional
+        If given, the points are processed in chunks of at most this size
+        to bound peak memory. By default, the "cholesky" method uses chunks
+        whose whitened distances have at most `_WHITENED_CHUNK_ELEMENTS`
+        elements, and the other methods process all the points at once.
+
+    Returns
+    -------
+    torch.Tensor
+        Log-likelihoods for each class with shape (n_points, n_classes).
+    """
+    if method not in FACTORIZED_LOG_LIKELIHOOD_METHODS:
+        raise ValueError(
+            f"Unknown log-likelihood method '{method}'. "
+            f"Available methods are {FACTORIZED_LOG_LIKELIHOOD_METHODS}."
+        )
+
+    if cholesky.shape[-3] == 1:
+        # Covariance shared by all classes: linear discriminant form
+        return _chunked(
+            lambda chunk: _shared_log_likelihoods(
+                chunk, means, cholesky, log_determinants
+            ),
+            points,
+            chunk_size,
+        )
+    elif method == "cholesky":
+        if chunk_size is None:
+            # Bound the (..., n_classes, n_dim, n_points) whitened distances,
+            # where the leading dimensions are those of `means` (e.g. the
+            # models of an ensemble), broadcast with those of `points`
+            elements_per_point = torch.broadcast_shapes(
+                means.shape, points.shape[:-2] + means.shape[-2:]
+            ).numel()
+            chunk_size = max(1, _WHITENED_CHUNK_ELEMENTS // elements_per_point)
+        return _chunked(
+            lambda chunk: _cholesky_log_likelihoods(
+                chunk, means, cholesky, log_determinants
+            ),
+            points,
+            chunk_size,
+        )
+    else:
+        precisions = torch.cholesky_inverse(cholesky)
+        precision_means = torch.einsum("...cdb,...cb->...cd", precisions, means)
+        mean_terms = torch.sum(precision_means * means, dim=-1)
+        return _chunked(
+            lambda chunk: _quadratic_log_likelihoods(
+                chunk, precisions, precision_means, mean_terms, log_determinants
+            ),
+            points,
+            chunk_size,
+        )
+
+
+def _chunked(function, points, chunk_size):
+    """Apply `function` to chunks of `points` and concatenate the outputs."""
+    if chunk_size is None or points.shape[-2] <= chunk_size:
+        return function(points)
+    chunks = points.split(chunk_size, dim=-2)
+    return torch.cat([function(chunk) for chunk in chunks], dim=-2)
+
+
+def _log_likelihood_constant(n_dim, log_determinants):
+    return -0.5 * n_dim * torch.log(2 * torch.tensor(torch.pi)) - 0.5 * log_determinants
+
+
+def _inverse_log_likelihoods(points, means, precisions, log_determinants):
     n_dim = points.shape[-1]
     # Distances from means
-    distances = points.unsqueeze(1) - means.unsqueeze(0)
+    distances = points.unsqueeze(-2) - means.unsqueeze(-3)
     # Quadratic component of log-likelihood
     quadratic_term = -0.5 * torch.einsum(
-        "ncd,cdb,ncb->nc", distances, covariances.inverse(), distances
+        "...ncd,...cdb,...ncb->...nc", distances, precisions, distances
     )
-    # Constant term
-    constant = -0.5 * n_dim * torch.log(
-        2 * torch.tensor(torch.pi)
-    ) - 0.5 * torch.logdet(covariances)
-    # 4) Add quadratics and constants to get log-likelihood
-    return quadratic_term + constant.unsqueeze(0)
+    # Add quadratics and constants to get log-likelihood
+    constant = _log_likelihood_constant(n_dim, log_determinants)
+    return quadratic_term + constant.unsqueeze(-2)
 
 
-def class_statistics(points, labels):
+def _cholesky_log_likelihoods(points, means, cholesky, log_determinants):
+    n_dim = points.shape[-1]
+    # Distances from means, arranged as (n_classes, n_dim, n_points)
+    distances = points.mT.unsqueeze(-3) - means.unsqueeze(-1)
+    # Whiten the distances with the Cholesky factor of each class
+    whitened = torch.linalg.solve_triangular(cholesky, distances, upper=False)
+    # Quadratic component of log-likelihood
+    quadratic_term = -0.5 * torch.sum(whitened**2, dim=-2).mT
+    # Add quadratics and constants to get log-likelihood
+    constant = _log_likelihood_constant(n_dim, log_determinants)
+    return quadratic_term + constant.unsqueeze(-2)
+
+
+def _shared_log_likelihoods(points, means, cholesky, log_determinants):
+    n_dim = points.shape[-1]
+    # Whiten the points and the means once with the shared Cholesky factor
+    cholesky = cholesky.squeeze(-3)
+    whitened_points = torch.linalg.solve_triangular(cholesky, points.mT, upper=False).mT
+    whitened_means = torch.linalg.solve_triangular(cholesky, means.mT, upper=False).mT
+    # Quadratic component of log-likelihood, |z|^2 - 2 z'm + |m|^2
+    quadratic_term = -0.5 * (
+        torch.sum(whitened_points**2, dim=-1, keepdim=True)
+        - 2 * whitened_points @ whitened_means.mT
+        + torch.sum(whitened_means**2, dim=-1).unsqueeze(-2)
+    )
+    # Add quadratics and constants to get log-likelihood
+    constant = _log_likelihood_constant(n_dim, log_determinants)
+    return quadratic_term + constant.unsqueeze(-2)
+
+
+def _quadratic_log_likelihoods(
+    points, precisions, precision_means, mean_terms, log_determinants
+):
+    n_dim = points.shape[-1]
+    # x'Px for every class as a product of flattened outer products
+    outer_products = (points.unsqueeze(-1) * points.unsqueeze(-2)).flatten(-2, -1)
+    point_terms = outer_products @ precisions.flatten(-2, -1).mT
+    # x'Pm for every class
+    cross_terms = points @ precision_means.mT
+    # Quadratic component of log-likelihood
+    quadratic_term = -0.5 * (point_terms - 2 * cross_terms + mean_terms.unsqueeze(-2))
+    # Add quadratics and constants to get log-likelihood
+    constant = _log_likelihood_constant(n_dim, log_determinants)
+    return quadratic_term + constant.unsqueeze(-2)
+
+
+def class_statistics(points, labels, weights=None, n_classes=None):
     """
     Compute the mean and covariance of each class.
 
+    All classes are processed together: the means are accumulated with
+    `index_add_`, and the scatter matrices are batched matrix products of
+    the centered points of each class, padded with zeros to the size of the
+    largest class. The outputs have the dtype and device of `points`.
+
     Parameters
     ----------
     points : torch.Tensor
         Data points with shape (n_points, n_dim).
     labels : torch.Tensor
         Class labels of each point with shape (n_points).
+    weights : torch.Tensor, optional
+        Non-negative weight of each point with shape (n_points), by default
+        None (all points have the same weight). Covariances are normalized
+        as in `torch.cov` with `aweights`.
+    n_classes : int, optional
+        Number of classes, by default `max(labels) + 1`.
 
     Returns
     -------
@@ -60,12 +308,554 @@ def class_statistics(points, labels):
         - covariances: torch.Tensor of shape (n_classes, n_dim, n_dim), the
             covariance matrix of each class.
     """
-    n_classes = int(torch.max(labels) + 1)
-    n_dim = points.shape[-1]
-    means = torch.zeros(n_classes, n_dim)
-    covariances = torch.zeros(n_classes, n_dim, n_dim)
-    for i in range(n_classes):
-        indices = (labels == i).nonzero().squeeze(1)
-        means[i] = torch.mean(points[indices], dim=0)
-        covariances[i] = torch.cov(points[indices].t())
-    return {"means": means, "covariances": covariances}
+    if n_classes is None:
+        n_classes = int(torch.max(labels) + 1)
+    moments = _class_moments(points, labels, weights, n_classes)
+    return {
+        "means": moments["means"],
+        "covariances": _moments_2_covariances(moments),
+    }
+
+
+def low_rank_class_statistics(points, labels, rank, n_classes=None, shared=False):
+    """
+    Compute the mean and a low-rank-plus-diagonal covariance of each class.
+
+    The covariance of each class is approximated as `U @ U.T + diag(d)`,
+    where `U` contains its `rank` leading principal components (scaled by
+    the square root of their variance), found with a randomized SVD of the
+    centered points of the class, and `d` is the variance not explained by
+    them. The (n_dim, n_dim) covariance matrices are never formed.
+
+    Parameters
+    ----------
+    points : torch.Tensor
+        Data points with shape (n_points, n_dim).
+    labels : torch.Tensor
+        Class labels of each point with shape (n_points).
+    rank : int
+        Number of principal components of each class.
+    n_classes : int, optional
+        Number of classes, by default `max(labels) + 1`.
+    shared : bool, optional
+        If True, a single covariance shared by all classes (the pooled
+        within-class covariance) is computed instead, by default False.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+        - means: torch.Tensor of shape (n_classes, n_dim), the mean of each class.
+        - factors: torch.Tensor of shape (n_classes, n_dim, rank), or
+            (1, n_dim, rank) if `shared`, the low-rank factor `U` of each
+            covariance matrix.
+        - diagonals: torch.Tensor of shape (n_classes, n_dim), or (1, n_dim)
+            if `shared`, the diagonal `d` of each covariance matrix.
+    """
+    if n_classes is None:
+        n_classes = int(torch.max(labels) + 1)
+    labels = labels.to(points.device)
+
+    # Class means, as in `_class_moments`
+    counts = torch.bincount(labels, minlength=n_classes)
+    means = points.new_zeros(n_classes, points.shape[-1])
+    means.index_add_(0, labels, points)
+    means = means / torch.clamp(counts, min=1).unsqueeze(-1).to(points.dtype)
+    centered = points - means[labels]
+
+    if shared:
+        # Pooled within-class covariance, normalized by n_points - n_classes
+        normalization = max(points.shape[0] - int(torch.count_nonzero(counts)), 1)
+        factors, variances = _low_rank_factors(
+            centered / math.sqrt(normalization), rank
+        )
+        factors, variances = factors.unsqueeze(0), variances.unsqueeze(0)
+    else:
+        # Centered points of all the classes at once, padded with zeros
+        normalization = torch.clamp(counts - 1, min=1).to(points.dtype)
+        class_points = _pad_classes(centered, labels, counts)
+        factors, variances = _low_rank_factors(
+            class_points / torch.sqrt(normalization)[:, None, None], rank
+        )
+
+    diagonals = torch.clamp(variances - torch.sum(factors**2, dim=-1), min=0)
+    return {"means": means, "factors": factors, "diagonals": diagonals}
+
+
+def _pad_classes(points, labels, counts):
+    """Arrange points as (n_classes, max(counts), n_dim), padded with zeros."""
+    order = torch.argsort(labels, stable=True)
+    sorted_labels = labels[order]
+    starts = torch.cumsum(counts, dim=0) - counts
+    positions = torch.arange(points.shape[0], device=points.device)
+    positions = positions - starts[sorted_labels]
+    class_points = points.new_zeros(
+        counts.shape[0], int(counts.max()), points.shape[-1]
+    )
+    class_points[sorted_labels, positions] = points[order]
+    return class_points
+
+
+def _low_rank_factors(points, rank):
+    """
+    Scaled leading principal components `U` and total variances of the
+    rows of `points` (..., n_points, n_dim), with `U @ U.T` approximating
+    `points.T @ points`.
+    """
+    n_components = min(rank + _LOW_RANK_OVERSAMPLING, *points.shape[-2:])
+    _, singular_values, components = torch.svd_lowrank(points, q=n_components)
+    n_kept = min(rank, n_components)
+    factors = points.new_zeros(*points.shape[:-2], points.shape[-1], rank)
+    factors[..., :n_kept] = (
+        components[..., :n_kept] * singular_values[..., None, :n_kept]
+    )
+    return factors, torch.sum(points**2, dim=-2)
+
+
+def pooled_covariance(covariances, weights):
+    """
+    Compute the weighted average of the class covariances.
+
+    Parameters
+    ----------
+    covariances : torch.Tensor
+        Covariance matrix of each class with shape (n_classes, n_dim, n_dim).
+    weights : torch.Tensor
+        Non-negative weight of each class with shape (n_classes), e.g. the
+        number of points of each class minus one for the pooled
+        within-class covariance.
+
+    Returns
+    -------
+    torch.Tensor
+        Pooled covariance with shape (1, n_dim, n_dim), which broadcasts
+        against the class dimension.
+    """
+    weights = torch.as_tensor(
+        weights, dtype=covariances.dtype, device=covariances.device
+    )
+    pooled = torch.einsum("c,cdb->db", weights / torch.sum(weights), covariances)
+    return pooled.unsqueeze(0)
+
+
+def low_rank_covariances(covariances, rank):
+    """
+    Approximate covariance matrices as low-rank-plus-diagonal matrices.
+
+    Each covariance is approximated as `U @ U.T + diag(d)`, with its `rank`
+    leading eigenvectors in `U` (scaled by the square root of their
+    eigenvalues) and the remaining variance in `d`, as in
+    `low_rank_class_statistics`.
+
+    Parameters
+    ----------
+    covariances : torch.Tensor
+        Covariance matrices with shape (n_classes, n_dim, n_dim).
+    rank : int
+        Number of eigenvectors of each covariance.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+        - factors: torch.Tensor of shape (n_classes, n_dim, rank).
+        - diagonals: torch.Tensor of shape (n_classes, n_dim).
+    """
+    # Eigenvalues in ascending order
+    eigenvalues, eigenvectors = torch.linalg.eigh(covariances)
+    factors = eigenvectors[..., -rank:] * torch.sqrt(
+        torch.clamp(eigenvalues[..., -rank:], min=0)
+    ).unsqueeze(-2)
+    diagonals = torch.clamp(
+        torch.diagonal(covariances, dim1=-2, dim2=-1) - torch.sum(factors**2, dim=-1),
+        min=0,
+    )
+    return {"factors": factors, "diagonals": diagonals}
+
+
+def mixture_covariance(means, covariances, weights):
+    """
+    Compute the covariance of the mixture of the classes.
+
+    Parameters
+    ----------
+    means : torch.Tensor
+        Mean of each class with shape (n_classes, n_dim).
+    covariances : torch.Tensor
+        Covariance matrix of each class with shape (n_classes, n_dim, n_dim).
+    weights : torch.Tensor
+        Non-negative weight of each class with shape (n_classes), e.g. the
+        number of points or the prior of each class.
+
+    Returns
+    -------
+    torch.Tensor
+        Covariance of the mixture with shape (n_dim, n_dim), i.e. the
+        average within-class covariance plus the covariance of the means.
+    """
+    weights = torch.as_tensor(weights, dtype=means.dtype, device=means.device)
+    weights = weights / torch.sum(weights)
+    mean = weights @ means
+    centered_means = means - mean
+    return torch.einsum("c,cdb->db", weights, covariances) + torch.einsum(
+        "c,cd,cb->db", weights, centered_means, centered_means
+    )
+
+
+def principal_components(points, n_components):
+    """
+    Compute the leading principal components of a set of points.
+
+    The components are found with a randomized SVD of the centered points,
+    without forming their (n_dim, n_dim) covariance matrix.
+
+    Parameters
+    ----------
+    points : torch.Tensor
+        Data points with shape (n_points, n_dim).
+    n_components : int
+        Number of principal components.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+        - components: torch.Tensor of shape (n_dim, n_components), the
+            orthonormal principal components, by decreasing variance.
+        - variances: torch.Tensor of shape (n_components), the variance of
+            the points along each component.
+    """
+    if n_components > min(points.shape):
+        raise ValueError(
+            f"Can't compute {n_components} principal components of "
+            f"{points.shape[0]} points of dimension {points.shape[1]}."
+        )
+    centered = points - torch.mean(points, dim=0)
+    n_svd_components = min(n_components + _LOW_RANK_OVERSAMPLING, *centered.shape)
+    _, singular_values, components = torch.svd_lowrank(centered, q=n_svd_components)
+    variances = singular_values[:n_components] ** 2 / max(points.shape[0] - 1, 1)
+    return {"components": components[:, :n_components], "variances": variances}
+
+
+def covariance_principal_components(covariance, n_components):
+    """
+    Compute the leading principal components from a covariance matrix.
+
+    Parameters
+    ----------
+    covariance : torch.Tensor
+        Covariance matrix with shape (n_dim, n_dim), e.g. the output of
+        `mixture_covariance`.
+    n_components : int
+        Number of principal components.
+
+    Returns
+    -------
+    dict
+        A dictionary containing:
+        - components: torch.Tensor of shape (n_dim, n_components), the
+            orthonormal principal components, by decreasing variance.
+        - variances: torch.Tensor of shape (n_components), the variance
+            along each component.
+    """
+    # Eigenvalues in ascending order
+    eigenvalues, eigenvectors = torch.linalg.eigh(covariance)
+    return {
+        "components": eigenvectors[:, -n_components:].flip(-1),
+        "variances": torch.clamp(eigenvalues[-n_components:].flip(-1), min=0),
+    }
+
+
+class ClassStatisticsAccumulator:
+    """
+    Accumulate the mean and covariance of each class over batches of points.
+
+    The per-class weight sums, means and scatter matrices of each batch are
+    merged with the pairwise update of Chan et al., so the full dataset
+    never needs to be in memory. Accumulators filled with different parts
+    of a dataset can be combined with `merge`.
+
+    With a `rank`, the (n_dim, n_dim) scatter matrices are never formed:
+    each one is kept as a sketch `S` with `rank` plus a few extra columns,
+    such that `S @ S.T` approximates the scatter matrix, together with its
+    exact diagonal. Merging concatenates the sketches and truncates them
+    with an SVD, as in incremental PCA, and the covariances are returned
+    in the low-rank-plus-diagonal form of `low_rank_class_statistics`.
+    """
+
+    def __init__(self, n_classes=0, dtype=None, device=None, rank=None):
+        """
+        Initialize an empty accumulator.
+
+        Parameters
+        ----------
+        n_classes : int, optional
+            Number of classes. The accumulator grows when it receives
+            labels of new classes, by default 0.
+        dtype : torch.dtype, optional
+            Dtype of the accumulated statistics, by default the dtype of
+            the first batch.
+        device : torch.device, optional
+            Device of the accumulated statistics, by default the device of
+            the first batch.
+        rank : int, optional
+            If given, the covariances are accumulated as low-rank-plus-diagonal
+            matrices with this rank, by default None (full covariances).
+        """
+        self.n_classes = n_classes
+        self.dtype = dtype
+        self.device = device
+        self.rank = rank
+        self.moments = None
+
+    def update(self, points, labels, weights=None):
+        """
+        Add a batch of points to the statistics.
+
+        Parameters
+        ----------
+        points : torch.Tensor
+            Data points with shape (n_points, n_dim).
+        labels : torch.Tensor
+            Class labels of each point with shape (n_points).
+        weights : torch.Tensor, optional
+            Non-negative weight of each point with shape (n_points),
+            by default None (all points have the same weight).
+
+        Returns
+        -------
+        ClassStatisticsAccumulator
+            The accumulator itself.
+        """
+        if self.dtype is None:
+            self.dtype = points.dtype
+        if self.device is None:
+            self.device = points.device
+        points = points.to(dtype=self.dtype, device=self.device)
+        n_classes = max(self.n_classes, int(torch.max(labels) + 1))
+        moments = _class_moments(points, labels, weights, n_classes, self.rank)
+        return self._merge_moments(moments)
+
+    def merge(self, other):
+        """
+        Add the statistics accumulated by another accumulator.
+
+        Parameters
+        ----------
+        other : ClassStatisticsAccumulator
+            Accumulator to merge into this one.
+
+        Returns
+        -------
+        ClassStatisticsAccumulator
+            The accumulator itself.
+        """
+        if other.moments is None:
+            return self
+        if other.rank != self.rank:
+            raise ValueError(
+                f"Can't merge an accumulator of rank {other.rank} into one "
+                f"of rank {self.rank}."
+            )
+        if self.dtype is None:
+            self.dtype = other.dtype
+        if self.device is None:
+            self.device = other.device
+        moments = {
+            name: moment.to(dtype=self.dtype, device=self.device)
+            for name, moment in other.moments.items()
+        }
+        return self._merge_moments(moments)
+
+    def statistics(self):
+        """
+        Return the accumulated class statistics.
+
+        Returns
+        -------
+        dict
+            A dictionary containing:
+            - means: torch.Tensor of shape (n_classes, n_dim), the mean of
+                each class.
+            - covariances: torch.Tensor of shape (n_classes, n_dim, n_dim),
+                the covariance matrix of each class. Only without `rank`.
+            - factors, diagonals: torch.Tensor of shapes
+                (n_classes, n_dim, rank) and (n_classes, n_dim), the
+                low-rank-plus-diagonal covariances (see
+                `low_rank_class_statistics`). Only with `rank`.
+            - counts: torch.Tensor of shape (n_classes), the total weight
+                (number of points, if unweighted) of each class.
+        """
+        if self.moments is None:
+            raise RuntimeError("No points have been added to the accumulator.")
+        statistics = {"means": self.moments["means"]}
+        if self.rank is None:
+            statistics["covariances"] = _moments_2_covariances(self.moments)
+        else:
+            statistics.update(_moments_2_low_rank_covariances(self.moments, self.rank))
+        statistics["counts"] = self.moments["weight_sums"]
+        return statistics
+
+    def _merge_moments(self, moments):
+        n_classes = max(self.n_classes, moments["weight_sums"].shape[0])
+        moments = _pad_moments(moments, n_classes)
+        if self.moments is None:
+            self.moments = moments
+            self.n_classes = n_classes
+            return self
+        current = _pad_moments(self.moments, n_classes)
+
+        weight_sums = current["weight_sums"] + moments["weight_sums"]
+        safe_weight_sums = torch.where(weight_sums > 0, weight_sums, 1)
+        deltas = moments["means"] - current["means"]
+        mean_update = (moments["weight_sums"] / safe_weight_sums).unsqueeze(-1)
+        scatter_update = (
+            current["weight_sums"] * moments["weight_sums"] / safe_weight_sums
+        )[:, None, None]
+
+        self.moments = {
+            "weight_sums": weight_sums,
+            "squared_weight_sums": (
+                current["squared_weight_sums"] + moments["squared_weight_sums"]
+            ),
+            "means": current["means"] + deltas * mean_update,
+        }
+        if self.rank is None:
+            self.moments["scatter"] = (
+                current["scatter"]
+                + moments["scatter"]
+                + scatter_update * deltas.unsqueeze(-1) * deltas.unsqueeze(-2)
+            )
+        else:
+            self.moments["scatter_diagonals"] = (
+                current["scatter_diagonals"]
+                + moments["scatter_diagonals"]
+                + scatter_update[:, :, 0] * deltas**2
+            )
+            # The merged scatter is the sum of the outer products of the
+            # columns of the sketches and of the scaled mean difference
+            columns = torch.cat(
+                [
+                    current["sketch"],
+                    moments["sketch"],
+                    (torch.sqrt(scatter_update[:, :, 0]) * deltas).unsqueeze(-1),
+                ],
+                dim=-1,
+            )
+            left_vectors, singular_values, _ = torch.linalg.svd(
+                columns, full_matrices=False
+            )
+            n_columns = current["sketch"].shape[-1]
+            self.moments["sketch"] = (
+                left_vectors[..., :n_columns] * singular_values[:, None, :n_columns]
+            )
+        self.n_classes = n_classes
+        return self
+
+
+def _class_moments(points, labels, weights, n_classes, rank=None):
+    """
+    Weight sums, means and scatter matrices of each class, or, with a
+    `rank`, sketches and diagonals of the scatter matrices.
+    """
+    n_points, n_dim = points.shape
+    dtype = points.dtype
+    device = points.device
+    labels = labels.to(device)
+
+    if weights is None:
+        weights = torch.ones(n_points, dtype=dtype, device=device)
+    else:
+        weights = torch.as_tensor(weights, dtype=dtype, device=device)
+
+    # Weighted class means (zero for classes without points)
+    weight_sums = torch.zeros(n_classes, dtype=dtype, device=device)
+    weight_sums.index_add_(0, labels, weights)
+    squared_weight_sums = torch.zeros(n_classes, dtype=dtype, device=device)
+    squared_weight_sums.index_add_(0, labels, weights**2)
+    means = torch.zeros(n_classes, n_dim, dtype=dtype, device=device)
+    means.index_add_(0, labels, points * weights.unsqueeze(-1))
+    means = means / torch.where(weight_sums > 0, weight_sums, 1).unsqueeze(-1)
+    moments = {
+        "weight_sums": weight_sums,
+        "squared_weight_sums": squared_weight_sums,
+        "means": means,
+    }
+
+    if rank is not None:
+        # The weighted centered points of each class are an exact sketch,
+        # truncated to the leading principal components
+        weighted = (points - means[labels]) * torch.sqrt(weights).unsqueeze(-1)
+        counts = torch.bincount(labels, minlength=n_classes)
+        sketch, scatter_diagonals = _low_rank_factors(
+            _pad_classes(weighted, labels, counts), rank + _LOW_RANK_OVERSAMPLING
+        )
+        moments["sketch"] = sketch
+        moments["scatter_diagonals"] = scatter_diagonals
+        return moments
+
+    # Weighted scatter matrices, as batched products of the zero-padded
+    # centered points of each class. Classes are processed in groups, to
+    # bound the size of the padded points when the classes are unbalanced
+    weighted = (points - means[labels]) * torch.sqrt(weights).unsqueeze(-1)
+    counts = torch.bincount(labels, minlength=n_classes)
+    max_elements = max(_PADDED_CLASSES_CHUNK_ELEMENTS, points.numel())
+    scatter = torch.zeros(n_classes, n_dim, n_dim, dtype=dtype, device=device)
+    for start, stop in _class_groups(counts, n_dim, max_elements):
+        if (start, stop) == (0, n_classes):
+            group_points, group_labels = weighted, labels
+        else:
+            in_group = (labels >= start) & (labels < stop)
+            group_points, group_labels = weighted[in_group], labels[in_group] - start
+        class_points = _pad_classes(group_points, group_labels, counts[start:stop])
+        scatter[start:stop] = class_points.mT @ class_points
+
+    moments["scatter"] = scatter
+    return moments
+
+
+def _class_groups(counts, n_dim, max_elements):
+    """
+    Contiguous ranges of classes whose zero-padded points, of shape
+    (n_classes, max(counts), n_dim), have at most `max_elements` elements
+    (or that contain a single class).
+    """
+    groups = []
+    start = 0
+    max_count = 0
+    for index, count in enumerate(counts.tolist()):
+        max_count = max(max_count, count)
+        if index > start and (index + 1 - start) * max_count * n_dim > max_elements:
+            groups.append((start, index))
+            start = index
+            max_count = count
+    groups.append((start, len(counts)))
+    return groups
+
+
+def _moments_2_covariances(moments):
+    """Unbiased covariances (reduces to n - 1 normalization for unweighted points)."""
+    weight_sums = moments["weight_sums"]
+    normalization = weight_sums - moments["squared_weight_sums"] / weight_sums
+    return moments["scatter"] / normalization[:, None, None]
+
+
+def _moments_2_low_rank_covariances(moments, rank):
+    """Low-rank-plus-diagonal covariances from the scatter sketches."""
+    weight_sums = moments["weight_sums"]
+    normalization = weight_sums - moments["squared_weight_sums"] / weight_sums
+    factors = moments["sketch"][..., :rank] / torch.sqrt(normalization)[:, None, None]
+    variances = moments["scatter_diagonals"] / normalization.unsqueeze(-1)
+    diagonals = torch.clamp(variances - torch.sum(factors**2, dim=-1), min=0)
+    return {"factors": factors, "diagonals": diagonals}
+
+
+def _pad_moments(moments, n_classes):
+    """Pad class moments with empty classes up to `n_classes`."""
+    n_missing = n_classes - moments["weight_sums"].shape[0]
+    if n_missing == 0:
+        return moments
+    return {
+        name: torch.cat([moment, moment.new_zeros((n_missing,) + moment.shape[1:])])
+        for name, moment in moments.items()
+    }
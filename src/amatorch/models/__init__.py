@@ -1,6 +1,7 @@
 from .ama_gauss import AMAGauss
+from .ama_gauss_ensemble import AMAGaussEnsemble
 
-__all__ = ["AMAGauss"]
+__all__ = ["AMAGauss", "AMAGaussEnsemble"]
 
 
 def __dir__():
@@ -5,6 +5,9 @@ from amatorch import inference, normalization
 from .ama_parent import AMAParent
 from .buffers_dict import BuffersDict
 
+# Version of the file format written by `AMAGauss.save_statistics`
+STATISTICS_FORMAT_VERSION = 1
+
 
 class AMAGauss(AMAParent):
     """
@@ -15,24 +18,35 @@ class AMAGauss(AMAParent):
 
     def __init__(
         self,
-        stimuli,
-        labels,
+        stimuli=None,
+        labels=None,
         n_filters=2,
         priors=None,
         response_noise=0.0,
         c50=0.0,
         device="cpu",
         dtype=torch.float32,
+        log_likelihood_method="cholesky",
+        log_likelihood_chunk_size=None,
+        stimulus_statistics=None,
+        n_channels=None,
+        covariance_rank=None,
+        shared_covariance=False,
+        n_components=None,
+        whiten=False,
+        statistics_dtype=None,
     ):
         """
         Initialize the AMAGauss model.
 
         Parameters
         ----------
-        stimuli : torch.Tensor
-            Stimulus tensor of shape (n_stim, n_channels, n_dim).
-        labels : torch.Tensor
-            Label tensor of shape (n_stim).
+        stimuli : torch.Tensor, optional
+            Stimulus tensor of shape (n_stim, n_channels, n_dim). Required
+            unless `stimulus_statistics` is given.
+        labels : torch.Tensor, optional
+            Label tensor of shape (n_stim). Required unless
+            `stimulus_statistics` is given.
         n_filters : int, optional
             Number of filters to use, by default 2.
         priors : torch.Tensor, optional
@@ -42,36 +56,398 @@ class AMAGauss(AMAParent):
         c50 : float, optional
             Offset added to the denominator when normalizing stimuli,
             by default 0.0.
+        device : str or torch.device, optional
+            Device of the parameters and buffers of the model,
+            by default "cpu".
+        dtype : torch.dtype, optional
+            Floating point dtype of the parameters and buffers of the
+            model, by default torch.float32.
+        log_likelihood_method : str, optional
+            How the Gaussian log-likelihoods are evaluated from the
+            factorized response statistics, either "cholesky" or "quadratic",
+            by default "cholesky". See `inference.gaussian_log_likelihoods`.
+        log_likelihood_chunk_size : int, optional
+            Maximum number of stimuli whose log-likelihoods are evaluated at
+            once, to bound the memory of the intermediate tensors. By
+            default, it is chosen automatically for the "cholesky" method.
+            See `inference.factorized_gaussian_log_likelihoods`.
+        stimulus_statistics : dict, optional
+            Precomputed class statistics of the preprocessed stimuli, with
+            the channels collapsed. Must contain 'means' of shape
+            (n_classes, n_channels * n_dim) and either 'covariances' of shape
+            (n_classes, n_channels * n_dim, n_channels * n_dim), or the
+            'factors' and 'diagonals' of low-rank-plus-diagonal covariances
+            (see `inference.low_rank_class_statistics`). If given, `stimuli`
+            and `labels` are not used, by default None.
+        n_channels : int, optional
+            Number of channels of the stimuli. Required if
+            `stimulus_statistics` is given, by default None.
+        covariance_rank : int, optional
+            If given, the stimulus covariance of each class is stored as a
+            matrix of rank `covariance_rank` plus a diagonal, instead of a
+            full matrix. This reduces the memory of the statistics and the
+            cost of the response statistics from O(n_dim^2) to
+            O(n_dim * covariance_rank) for high-dimensional stimuli,
+            by default None.
+        shared_covariance : bool, optional
+            If True, all classes share the pooled within-class stimulus
+            covariance (classes are weighted by their number of stimuli, or
+            by their prior if the counts are unknown). The log-likelihoods
+            then take a linear discriminant form, with a single
+            factorization for all classes, by default False.
+        n_components : int, optional
+            If given, the preprocessed stimuli are projected on their
+            `n_components` leading principal components (stored in the
+            `components` buffer), and the filters and the stimulus statistics
+            live in this reduced space. The filters then have shape
+            (n_filters, 1, n_components), and `stimulus_filters` maps them
+            back to the space of the stimuli. The components are computed
+            from `stimuli`, or from the full covariances in
+            `stimulus_statistics`, by default None.
+        whiten : bool, optional
+            If True, the projected stimuli are also scaled to unit variance
+            along each principal component. Only used with `n_components`,
+            by default False.
+        statistics_dtype : torch.dtype, optional
+            If given, the stimulus statistics are computed and stored in this
+            dtype (e.g. torch.float64) instead of `dtype`, and they keep it
+            when the model is cast (e.g. with `model.to(torch.bfloat16)`).
+            The filters and the responses then use the dtype of the model,
+            while the response statistics, their factorization and the
+            log-likelihoods are computed in `statistics_dtype`, casting the
+            filters and the responses to it, by default None.
         """
         # Initialize
-        n_channels = stimuli.shape[-2]
-        n_classes = torch.unique(labels).size()[0]
+        if stimulus_statistics is None:
+            if stimuli is None or labels is None:
+                raise ValueError(
+                    "Either `stimuli` and `labels` or `stimulus_statistics` "
+                    "must be given."
+                )
+            n_channels = stimuli.shape[-2]
+            n_dim = stimuli.shape[-1]
+            n_classes = torch.unique(labels).size()[0]
+        else:
+            if n_channels is None:
+                raise ValueError(
+                    "`n_channels` must be given together with `stimulus_statistics`."
+                )
+            n_dim = stimulus_statistics["means"].shape[-1] // n_channels
+            n_classes = stimulus_statistics["means"].shape[0]
 
         if priors is None:
             priors = torch.ones(n_classes) / n_classes
 
+        # Filters are learned in the space of the principal components
         super().__init__(
-            n_dim=stimuli.shape[-1],
+            n_dim=n_dim if n_components is None else n_components,
             n_filters=n_filters,
             priors=priors,
-            n_channels=n_channels,
+            n_channels=n_channels if n_components is None else 1,
         )
         self.register_buffer("c50", torch.as_tensor(c50))
         self.register_buffer("response_noise", torch.as_tensor(response_noise))
+        if log_likelihood_method not in inference.FACTORIZED_LOG_LIKELIHOOD_METHODS:
+            raise ValueError(
+                f"Unknown log-likelihood method '{log_likelihood_method}'. "
+                "Available methods are "
+                f"{inference.FACTORIZED_LOG_LIKELIHOOD_METHODS}."
+            )
+        self.log_likelihood_method = log_likelihood_method
+        self.log_likelihood_chunk_size = log_likelihood_chunk_size
+
+        # Projection of the preprocessed stimuli, see `preprocess`
+        self.register_buffer("components", None)
+        self.whiten = whiten
+        if n_components is not None:
+            components = self._principal_components(
+                stimuli, stimulus_statistics, n_components, whiten
+            )
+            if stimulus_statistics is not None:
+                stimulus_statistics = _project_statistics(
+                    stimulus_statistics, components
+                )
+            self.components = components.unflatten(0, (n_channels, n_dim)).to(
+                device=device, dtype=dtype
+            )
 
         # Store stimuli statistics
-        stimulus_statistics = inference.class_statistics(
-            points=torch.flatten(self.preprocess(stimuli), -2, -1),  # Collapse channels
-            labels=labels,
+        stored_dtype = dtype if statistics_dtype is None else statistics_dtype
+        if stimulus_statistics is None:
+            # Collapse channels
+            points = torch.flatten(self.preprocess(stimuli), -2, -1).to(stored_dtype)
+            if covariance_rank is None:
+                stimulus_statistics = inference.class_statistics(
+                    points=points, labels=labels
+                )
+                stimulus_statistics["counts"] = torch.bincount(
+                    labels, minlength=n_classes
+                )
+            else:
+                stimulus_statistics = inference.low_rank_class_statistics(
+                    points=points,
+                    labels=labels,
+                    rank=covariance_rank,
+                    shared=shared_covariance,
+                )
+        if shared_covariance:
+            stimulus_statistics = self._pool_covariances(stimulus_statistics)
+        if covariance_rank is not None and "covariances" in stimulus_statistics:
+            stimulus_statistics = {
+                "means": stimulus_statistics["means"],
+                **inference.low_rank_covariances(
+                    stimulus_statistics["covariances"], covariance_rank
+                ),
+            }
+        if "covariances" in stimulus_statistics:
+            statistics_names = ("means", "covariances")
+        else:
+            statistics_names = ("means", "factors", "diagonals")
+        self.stimulus_statistics = BuffersDict(
+            {
+                name: stimulus_statistics[name].to(device=device, dtype=stored_dtype)
+                for name in statistics_names
+            },
+            dtype=statistics_dtype,
+        )
+        # Filters and the other buffers, created by default on CPU in float32
+        self.to(device=device, dtype=dtype)
+
+        # Factorized response statistics, reused while filters are unchanged
+        self._response_factors_cache = None
+        # Response statistics of the fixed filters, see `add_filters`
+        self._fixed_statistics_cache = None
+
+    def _principal_components(self, stimuli, stimulus_statistics, n_components, whiten):
+        """Principal components of the normalized stimuli, (n_dim, n_components)."""
+        if stimulus_statistics is None:
+            points = torch.flatten(
+                normalization.unit_norm_channels(stimuli, c50=self.c50), -2, -1
+            )
+            principal = inference.principal_components(points, n_components)
+        elif "covariances" in stimulus_statistics:
+            if "counts" in stimulus_statistics:
+                weights = stimulus_statistics["counts"]
+            else:
+                weights = self.priors
+            covariance = inference.mixture_covariance(
+                stimulus_statistics["means"],
+                stimulus_statistics["covariances"],
+                weights,
+            )
+            principal = inference.covariance_principal_components(
+                covariance, n_components
+            )
+        else:
+            raise ValueError(
+                "The principal components can't be computed from low-rank "
+                "class covariances. Pass the full covariances or the stimuli "
+                "instead."
+            )
+        components = principal["components"]
+        if whiten:
+            variances = principal["variances"]
+            min_variance = torch.finfo(variances.dtype).eps * torch.max(variances)
+            components = components / torch.sqrt(
+                torch.clamp(variances, min=min_variance)
+            )
+        return components
+
+    def _pool_covariances(self, stimulus_statistics):
+        """Replace the class covariances by the pooled covariance."""
+        if "covariances" not in stimulus_statistics:
+            if stimulus_statistics["factors"].shape[0] > 1:
+                raise ValueError(
+                    "Low-rank class covariances can't be pooled. Pass the full "
+                    "covariances or the stimuli instead."
+                )
+            return stimulus_statistics
+        covariances = stimulus_statistics["covariances"]
+        if covariances.shape[0] == 1:
+            return stimulus_statistics
+        if "counts" in stimulus_statistics:
+            weights = torch.clamp(stimulus_statistics["counts"] - 1, min=0)
+        else:
+            weights = self.priors
+        return {
+            **stimulus_statistics,
+            "covariances": inference.pooled_covariance(covariances, weights),
+        }
+
+    @classmethod
+    def from_batches(cls, batches, **kwargs):
+        """
+        Initialize the AMAGauss model from batches of stimuli.
+
+        The class statistics are accumulated batch by batch with
+        `AMAGauss.accumulate_statistics`, so the full stimulus set never
+        needs to be in memory.
+
+        Parameters
+        ----------
+        batches : iterable
+            Iterable of (stimuli, labels) pairs, with stimuli of shape
+            (batch_size, n_channels, n_dim) and labels of shape (batch_size).
+        **kwargs
+            Other arguments passed to `AMAGauss`, except `stimuli`, `labels`,
+            `stimulus_statistics` and `n_channels`.
+
+        Returns
+        -------
+        AMAGauss
+            The initialized model.
+        """
+        statistics = cls.accumulate_statistics(
+            batches,
+            c50=kwargs.pop("c50", 0.0),
+            covariance_rank=kwargs.get("covariance_rank"),
+        )
+        return cls.from_statistics(statistics, **kwargs)
+
+    @classmethod
+    def from_statistics(cls, statistics, **kwargs):
+        """
+        Initialize the AMAGauss model from precomputed stimulus statistics.
+
+        Parameters
+        ----------
+        statistics : dict
+            Stimulus statistics as returned by `AMAGauss.accumulate_statistics`
+            or `AMAGauss.load_statistics`.
+        **kwargs
+            Other arguments passed to `AMAGauss`, except `stimuli`, `labels`,
+            `stimulus_statistics` and `n_channels`. If `c50` is given, it must
+            match the `c50` used to compute the statistics.
+
+        Returns
+        -------
+        AMAGauss
+            The initialized model.
+        """
+        c50 = kwargs.pop("c50", statistics["c50"])
+        if float(c50) != float(statistics["c50"]):
+            raise ValueError(
+                f"The statistics were computed with c50={float(statistics['c50'])}, "
+                f"but c50={float(c50)} was requested."
+            )
+        return cls(
+            stimulus_statistics=statistics,
+            n_channels=statistics["n_channels"],
+            c50=c50,
+            **kwargs,
         )
-        self.stimulus_statistics = BuffersDict(stimulus_statistics)
+
+    @staticmethod
+    def accumulate_statistics(batches, c50=0.0, covariance_rank=None):
+        """
+        Compute the class statistics of the preprocessed stimuli.
+
+        The statistics are accumulated batch by batch in double precision
+        with `inference.ClassStatisticsAccumulator`. They depend on `c50`,
+        but not on the number of filters or the response noise, so they
+        can be reused for different models.
+
+        Parameters
+        ----------
+        batches : iterable
+            Iterable of (stimuli, labels) pairs, with stimuli of shape
+            (batch_size, n_channels, n_dim) and labels of shape (batch_size).
+            To use a single tensor of stimuli, pass `[(stimuli, labels)]`.
+        c50 : float, optional
+            Offset added to the denominator when normalizing stimuli,
+            by default 0.0.
+        covariance_rank : int, optional
+            If given, the covariances are accumulated as low-rank-plus-diagonal
+            matrices of this rank, without forming the full covariances (see
+            `inference.ClassStatisticsAccumulator`), by default None.
+
+        Returns
+        -------
+        dict
+            A dictionary containing:
+            - 'means': torch.Tensor of shape (n_classes, n_channels * n_dim).
+            - 'covariances': torch.Tensor of shape
+                (n_classes, n_channels * n_dim, n_channels * n_dim), or, with
+                `covariance_rank`, the 'factors' and 'diagonals' of the
+                low-rank-plus-diagonal covariances.
+            - 'counts': torch.Tensor of shape (n_classes), the number of
+                stimuli of each class.
+            - 'n_channels': int, the number of channels of the stimuli.
+            - 'c50': float, the `c50` used for preprocessing.
+        """
+        c50 = torch.as_tensor(c50)
+        accumulator = inference.ClassStatisticsAccumulator(
+            dtype=torch.float64, rank=covariance_rank
+        )
+        n_channels = None
+        for stimuli, labels in batches:
+            n_channels = stimuli.shape[-2]
+            # Same preprocessing as `preprocess`
+            stimuli_processed = normalization.unit_norm_channels(stimuli, c50=c50)
+            accumulator.update(torch.flatten(stimuli_processed, -2, -1), labels)
+        statistics = accumulator.statistics()
+        statistics["n_channels"] = n_channels
+        statistics["c50"] = float(c50)
+        return statistics
+
+    @staticmethod
+    def save_statistics(statistics, path):
+        """
+        Save stimulus statistics to disk.
+
+        Parameters
+        ----------
+        statistics : dict
+            Stimulus statistics as returned by `AMAGauss.accumulate_statistics`.
+        path : str or os.PathLike
+            File in which to save the statistics.
+        """
+        # Full or low-rank-plus-diagonal covariances
+        tensors = {
+            name: statistics[name].cpu()
+            for name in ("means", "covariances", "factors", "diagonals", "counts")
+            if name in statistics
+        }
+        torch.save(
+            {
+                **tensors,
+                "n_channels": int(statistics["n_channels"]),
+                "c50": float(statistics["c50"]),
+                "format_version": STATISTICS_FORMAT_VERSION,
+            },
+            path,
+        )
+
+    @staticmethod
+    def load_statistics(path):
+        """
+        Load stimulus statistics saved with `AMAGauss.save_statistics`.
+
+        Parameters
+        ----------
+        path : str or os.PathLike
+            File containing the statistics.
+
+        Returns
+        -------
+        dict
+            Stimulus statistics, as returned by `AMAGauss.accumulate_statistics`.
+        """
+        statistics = torch.load(path, map_location="cpu")
+        format_version = statistics.pop("format_version", None)
+        if format_version != STATISTICS_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported statistics format version {format_version} in '{path}'."
+            )
+        return statistics
 
     def preprocess(self, stimuli):
         """
         Preprocess stimuli by normalizing each channel.
 
         Each channel of each stimulus is divided by the square root of the
-        sum of squares plus `c50`.
+        sum of squares plus `c50`. If the model has principal `components`,
+        the normalized stimuli are then projected on them.
 
         Parameters
         ----------
@@ -81,11 +457,40 @@ class AMAGauss(AMAParent):
         Returns
         -------
         torch.Tensor
-            Processed stimuli tensor of shape (n_stim, n_channels, n_dim).
+            Processed stimuli tensor of shape (n_stim, n_channels, n_dim),
+            or (n_stim, 1, n_components) if the model has principal
+            `components`.
         """
-        return normalization.unit_norm_channels(stimuli, c50=self.c50)
+        stimuli_processed = normalization.unit_norm_channels(stimuli, c50=self.c50)
+        if self.components is not None:
+            stimuli_processed = torch.einsum(
+                "ncd,cdr->nr",
+                stimuli_processed,
+                self.components.to(stimuli_processed.dtype),
+            ).unsqueeze(-2)
+        return stimuli_processed
 
-    def responses(self, stimuli):
+    @property
+    def stimulus_filters(self):
+        """
+        Return all the filters in the space of the stimuli.
+
+        For a model with principal `components`, the filters learned in the
+        reduced space are mapped back to the space of the stimuli, so that
+        their responses to the normalized stimuli are the model responses.
+        Otherwise, the filters are returned unchanged.
+
+        Returns
+        -------
+        torch.Tensor
+            Filters tensor of shape (n_filters, n_channels, n_dim).
+        """
+        filters = self.all_filters
+        if self.components is None:
+            return filters
+        return torch.einsum("...kr,cdr->...kcd", filters.squeeze(-2), self.components)
+
+    def responses(self, stimuli, preprocessed=False):
         """
         Compute the responses of the filters to the stimuli after
         pre-processing.
@@ -94,14 +499,19 @@ class AMAGauss(AMAParent):
         ----------
         stimuli : torch.Tensor
             Stimulus tensor of shape (n_stim, n_channels, n_dim).
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
 
         Returns
         -------
         torch.Tensor
             Responses tensor of shape (n_stim, n_filters).
         """
-        stimuli_processed = self.preprocess(stimuli)
-        responses = torch.einsum("kcd,ncd->nk", self.filters, stimuli_processed)
+        stimuli_processed = stimuli if preprocessed else self.preprocess(stimuli)
+        responses = torch.einsum(
+            "...kcd,ncd->...nk", self.all_filters, stimuli_processed
+        )
         return responses
 
     def responses_2_log_likelihoods(self, responses):
@@ -116,12 +526,17 @@ class AMAGauss(AMAParent):
         Returns
         -------
         torch.Tensor
-            Log-likelihoods tensor of shape (n_stim, n_classes).
+            Log-likelihoods tensor of shape (n_stim, n_classes), with the
+            dtype of the stimulus statistics.
         """
-        log_likelihoods = inference.gaussian_log_likelihoods(
-            responses,
-            self.response_statistics["means"],
-            self.response_statistics["covariances"],
+        response_factors = self.response_factors
+        log_likelihoods = inference.factorized_gaussian_log_likelihoods(
+            responses.to(response_factors["means"].dtype),
+            response_factors["means"],
+            response_factors["cholesky"],
+            response_factors["log_determinants"],
+            method=self.log_likelihood_method,
+            chunk_size=self.log_likelihood_chunk_size,
         )
         return log_likelihoods
 
@@ -130,6 +545,11 @@ class AMAGauss(AMAParent):
         """
         Return the class-conditional response statistics.
 
+        The statistics are computed in the dtype of the stimulus statistics.
+        The statistics of the fixed filters (see `add_filters`) are cached,
+        so that only the rows and columns of the trainable filters are
+        computed while they are trained.
+
         Returns
         -------
         dict
@@ -138,22 +558,39 @@ class AMAGauss(AMAParent):
             - 'covariances': torch.Tensor of shape (n_classes, n_filters, n_filters).
         """
         flat_filters = torch.flatten(self.filters, -2, -1)
-        dtype = flat_filters.dtype
+        dtype = self.stimulus_statistics["means"].dtype
         device = flat_filters.device
 
-        response_means = torch.einsum(
-            "cd,kd->ck", self.stimulus_statistics["means"], flat_filters
+        # Leading model dimensions of the filters (and of the response noise)
+        # are kept in the statistics, see `AMAGaussEnsemble`
+        response_means, response_covariances, projections = (
+            self._filter_response_statistics(flat_filters)
         )
 
-        noise_covariance = (
-            torch.eye(self.n_filters, dtype=dtype, device=device) * self.response_noise
-        )
-        response_covariances = torch.einsum(
-            "kd,cdb,mb->ckm",
-            flat_filters,
-            self.stimulus_statistics["covariances"],
-            flat_filters,
-        )
+        if self.fixed_filters.shape[-3] > 0:
+            fixed_statistics = self._fixed_response_statistics()
+            # Covariances between the fixed and the trainable filters
+            cross_covariances = torch.einsum(
+                "...md,...cdk->...cmk",
+                torch.flatten(self.fixed_filters, -2, -1).to(dtype),
+                projections,
+            )
+            response_means = torch.cat(
+                [fixed_statistics["means"], response_means], dim=-1
+            )
+            response_covariances = torch.cat(
+                [
+                    torch.cat(
+                        [fixed_statistics["covariances"], cross_covariances], dim=-1
+                    ),
+                    torch.cat([cross_covariances.mT, response_covariances], dim=-1),
+                ],
+                dim=-2,
+            )
+
+        noise_covariance = torch.eye(
+            self.n_filters, dtype=dtype, device=device
+        ) * self.response_noise[..., None, None, None].to(dtype)
 
         response_statistics = {
             "means": response_means,
@@ -161,6 +598,103 @@ class AMAGauss(AMAParent):
         }
         return response_statistics
 
+    def _filter_response_statistics(self, flat_filters):
+        """Response means, noiseless covariances and projected stimulus covariances."""
+        flat_filters = flat_filters.to(self.stimulus_statistics["means"].dtype)
+        response_means = torch.einsum(
+            "cd,...kd->...ck", self.stimulus_statistics["means"], flat_filters
+        )
+        # Stimulus covariances projected on the filters, of shape
+        # (..., n_classes, n_dim, n_filters)
+        if "covariances" in self.stimulus_statistics:
+            # Single matrix product over the flattened classes
+            stimulus_covariances = self.stimulus_statistics["covariances"]
+            projections = (
+                stimulus_covariances.flatten(0, 1) @ flat_filters.mT
+            ).unflatten(-2, stimulus_covariances.shape[:2])
+        else:
+            # (U @ U.T + diag(d)) @ F.T, without forming the covariances
+            factors = self.stimulus_statistics["factors"]
+            filters_t = flat_filters.mT.unsqueeze(-3)
+            projections = (
+                factors @ (factors.mT @ filters_t)
+                + self.stimulus_statistics["diagonals"].unsqueeze(-1) * filters_t
+            )
+        response_covariances = torch.einsum(
+            "...kd,...cdm->...ckm", flat_filters, projections
+        )
+        return response_means, response_covariances, projections
+
+    def _fixed_response_statistics(self):
+        """Response statistics of the fixed filters, cached until they change."""
+        key = _tensors_key(self.fixed_filters, *self.stimulus_statistics.values())
+        if (
+            key is None
+            or self._fixed_statistics_cache is None
+            or (self._fixed_statistics_cache[0] != key)
+        ):
+            means, covariances, _ = self._filter_response_statistics(
+                torch.flatten(self.fixed_filters, -2, -1)
+            )
+            statistics = {"means": means, "covariances": covariances}
+            if key is None:
+                return statistics
+            self._fixed_statistics_cache = (key, statistics)
+        return self._fixed_statistics_cache[1]
+
+    @property
+    def response_factors(self):
+        """
+        Return the class-conditional response statistics with the
+        covariances in factorized form.
+
+        When the filters are not being differentiated (e.g. under
+        `torch.no_grad`), the factorization is cached and reused until the
+        filters or the stimulus statistics change. It is not cached for
+        models whose tensors were created or cast under
+        `torch.inference_mode`, whose changes can't be tracked.
+
+        Returns
+        -------
+        dict
+            A dictionary containing:
+            - 'means': torch.Tensor of shape (n_classes, n_filters).
+            - 'cholesky': torch.Tensor of shape (n_classes, n_filters, n_filters),
+              or (1, n_filters, n_filters) with a shared covariance.
+            - 'log_determinants': torch.Tensor of shape (n_classes), or (1)
+              with a shared covariance.
+        """
+        filters_original = self.parametrizations.filters.original
+        # Factors computed with autograd on can't be reused across backward passes
+        if torch.is_grad_enabled() and filters_original.requires_grad:
+            return self._factorize_response_statistics()
+
+        key = self._response_factors_key()
+        if key is None:
+            return self._factorize_response_statistics()
+        if self._response_factors_cache is None or (
+            self._response_factors_cache[0] != key
+        ):
+            self._response_factors_cache = (
+                key,
+                self._factorize_response_statistics(),
+            )
+        return self._response_factors_cache[1]
+
+    def _factorize_response_statistics(self):
+        response_statistics = self.response_statistics
+        return inference.gaussian_factors(
+            response_statistics["means"], response_statistics["covariances"]
+        )
+
+    def _response_factors_key(self):
+        return _tensors_key(
+            self.parametrizations.filters.original,
+            self.fixed_filters,
+            self.response_noise,
+            *self.stimulus_statistics.values(),
+        )
+
     @response_statistics.setter
     def response_statistics(self):
         """
@@ -176,3 +710,31 @@ class AMAGauss(AMAParent):
             "They are computed from the filters and the "
             "stimulus statistics."
         )
+
+
+def _project_statistics(stimulus_statistics, components):
+    """Class statistics of the stimuli projected on `components`."""
+    components = components.to(stimulus_statistics["means"].dtype)
+    return {
+        **stimulus_statistics,
+        "means": stimulus_statistics["means"] @ components,
+        "covariances": components.mT @ stimulus_statistics["covariances"] @ components,
+    }
+
+
+def _tensors_key(*tensors):
+    """
+    Key that changes when any of `tensors` is modified or moved, or None if
+    changes can't be detected and the results must not be cached.
+    """
+    # Inference tensors (e.g. buffers created or cast under
+    # `torch.inference_mode`) have no version counter
+    if any(tensor.is_inference() for tensor in tensors):
+        return None
+    # In-place updates (optimizer steps, filter assignment) bump the
+    # version counter, and `.to()` changes the storage, dtype or device
+    key = tuple(
+        (tensor.data_ptr(), tensor._version, tensor.dtype, tensor.device)
+        for tensor in tensors
+    )
+    return key + (torch.is_inference_mode_enabled(),)
@@ -0,0 +1,167 @@
+import torch
+
+from .ama_gauss import AMAGauss
+
+
+class AMAGaussEnsemble(AMAGauss):
+    """
+    Ensemble of independent AMAGauss models that share the stimulus statistics.
+
+    The filters of the models are stacked along a leading model dimension,
+    so the responses, response statistics, log-likelihoods and losses of
+    all the models are computed together, in the same tensor operations.
+    The outputs of the inference methods have a leading model dimension
+    (e.g. responses of shape (n_models, n_stim, n_filters)), and training
+    the ensemble with `optim.fit` updates every model as if it were
+    trained on its own with the same batches.
+    """
+
+    def __init__(
+        self,
+        stimuli=None,
+        labels=None,
+        n_models=2,
+        n_filters=2,
+        priors=None,
+        response_noise=0.0,
+        c50=0.0,
+        device="cpu",
+        dtype=torch.float32,
+        log_likelihood_method="cholesky",
+        log_likelihood_chunk_size=None,
+        stimulus_statistics=None,
+        n_channels=None,
+        covariance_rank=None,
+        shared_covariance=False,
+        n_components=None,
+        whiten=False,
+        statistics_dtype=None,
+    ):
+        """
+        Initialize the AMAGaussEnsemble model.
+
+        Parameters
+        ----------
+        stimuli : torch.Tensor, optional
+            Stimulus tensor of shape (n_stim, n_channels, n_dim). Required
+            unless `stimulus_statistics` is given.
+        labels : torch.Tensor, optional
+            Label tensor of shape (n_stim). Required unless
+            `stimulus_statistics` is given.
+        n_models : int, optional
+            Number of models in the ensemble, by default 2.
+        n_filters : int, optional
+            Number of filters of each model, by default 2.
+        priors : torch.Tensor, optional
+            Prior probabilities of each class, by default None.
+        response_noise : float or torch.Tensor, optional
+            Noise level in the responses, either shared by all models or
+            one per model with shape (n_models), by default 0.0.
+        c50 : float, optional
+            Offset added to the denominator when normalizing stimuli,
+            by default 0.0.
+        device : str or torch.device, optional
+            Device of the parameters and buffers of the model,
+            by default "cpu".
+        dtype : torch.dtype, optional
+            Floating point dtype of the parameters and buffers of the
+            model, by default torch.float32.
+        log_likelihood_method : str, optional
+            How the Gaussian log-likelihoods are evaluated, by default
+            "cholesky". See `AMAGauss`.
+        log_likelihood_chunk_size : int, optional
+            Maximum number of stimuli whose log-likelihoods are evaluated at
+            once. See `AMAGauss`, by default None.
+        stimulus_statistics : dict, optional
+            Precomputed class statistics of the preprocessed stimuli.
+            See `AMAGauss`, by default None.
+        n_channels : int, optional
+            Number of channels of the stimuli. Required if
+            `stimulus_statistics` is given, by default None.
+        covariance_rank : int, optional
+            If given, the stimulus covariances are stored as low-rank plus
+            diagonal matrices. See `AMAGauss`, by default None.
+        shared_covariance : bool, optional
+            If True, all classes share the pooled stimulus covariance.
+            See `AMAGauss`, by default False.
+        n_components : int, optional
+            If given, the filters are learned in the space of the leading
+            principal components of the stimuli. See `AMAGauss`,
+            by default None.
+        whiten : bool, optional
+            If True, the principal components are scaled to unit variance.
+            See `AMAGauss`, by default False.
+        statistics_dtype : torch.dtype, optional
+            If given, the dtype in which the stimulus and response statistics
+            are kept. See `AMAGauss`, by default None.
+        """
+        super().__init__(
+            stimuli=stimuli,
+            labels=labels,
+            n_filters=n_filters,
+            priors=priors,
+            c50=c50,
+            device=device,
+            dtype=dtype,
+            log_likelihood_method=log_likelihood_method,
+            log_likelihood_chunk_size=log_likelihood_chunk_size,
+            stimulus_statistics=stimulus_statistics,
+            n_channels=n_channels,
+            covariance_rank=covariance_rank,
+            shared_covariance=shared_covariance,
+            n_components=n_components,
+            whiten=whiten,
+            statistics_dtype=statistics_dtype,
+        )
+        self.n_models = n_models
+        self.response_noise = (
+            torch.as_tensor(response_noise, dtype=dtype, device=device)
+            .expand(n_models)
+            .clone()
+        )
+
+        # Make initial random filters for every model
+        self.filters = torch.randn(
+            n_models, *self.filters.shape, dtype=dtype, device=device
+        )
+        self.fixed_filters = torch.empty(
+            n_models, *self.fixed_filters.shape, dtype=dtype, device=device
+        )
+
+    def model(self, index):
+        """
+        Return a copy of one model of the ensemble as an AMAGauss model.
+
+        Parameters
+        ----------
+        index : int
+            Index of the model in the ensemble.
+
+        Returns
+        -------
+        AMAGauss
+            Model with the filters and response noise of model `index`,
+            and the stimulus statistics of the ensemble.
+        """
+        model = AMAGauss(
+            n_filters=self.n_filters,
+            priors=self.priors.clone(),
+            response_noise=self.response_noise[index].clone(),
+            c50=self.c50.clone(),
+            device=self.priors.device,
+            dtype=self.parametrizations.filters.original.dtype,
+            log_likelihood_method=self.log_likelihood_method,
+            log_likelihood_chunk_size=self.log_likelihood_chunk_size,
+            stimulus_statistics={
+                name: tensor.clone()
+                for name, tensor in self.stimulus_statistics.items()
+            },
+            n_channels=self.filters.shape[-2],
+            statistics_dtype=self.stimulus_statistics.dtype,
+        )
+        # Copy the unnormalized parameter, so that training continues identically
+        model.filters = self.parametrizations.filters.original[index].detach().clone()
+        model.fixed_filters = self.fixed_filters[index].clone()
+        if self.components is not None:
+            model.components = self.components.clone()
+        return model
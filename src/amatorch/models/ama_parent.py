@@ -3,10 +3,22 @@ from abc import ABC, abstractmethod
 import torch
 import torch.nn as nn
 import torch.nn.functional as tfun
-from torch.nn.utils.parametrize import register_parametrization
+from torch.nn.utils.parametrize import cached, register_parametrization
 
 from amatorch import constraints
 
+# Quantities that can be requested from `AMAParent.batched_inference`
+INFERENCE_OUTPUTS = (
+    "responses",
+    "log_likelihoods",
+    "log_posteriors",
+    "posteriors",
+    "estimates",
+)
+
+# Default memory budget of `AMAParent.batched_inference`, in bytes
+DEFAULT_MEMORY_BUDGET = 2**28
+
 
 class AMAParent(ABC, nn.Module):
     """
@@ -38,6 +50,73 @@ class AMAParent(ABC, nn.Module):
         # Model parameters
         self.filters = nn.Parameter(filters)
         register_parametrization(self, "filters", constraints.Sphere())
+        # Filters frozen by `add_filters`, which are not trained
+        self.register_buffer("fixed_filters", torch.empty(0, n_channels, n_dim))
+
+    #########################
+    # FILTERS
+    #########################
+
+    @property
+    def all_filters(self):
+        """
+        Return the fixed filters followed by the trainable filters.
+
+        Returns
+        -------
+        torch.Tensor
+            Filters tensor of shape (n_filters, n_channels, n_dim).
+        """
+        return torch.cat([self.fixed_filters, self.filters], dim=-3)
+
+    def add_filters(self, n_filters):
+        """
+        Freeze the current filters and add new trainable filters.
+
+        The trainable filters are appended to `fixed_filters`, which are
+        no longer trained, and replaced by `n_filters` new random filters.
+        This allows learning the filters in stages (e.g. in pairs), with
+        each stage only training the filters that it adds.
+
+        After this call, `filters` (and the model parameters) contain only
+        the new trainable filters, and `all_filters` contains the full set
+        of filters used for the responses.
+
+        Parameters
+        ----------
+        n_filters : int
+            Number of new trainable filters.
+        """
+        with torch.no_grad():
+            self.fixed_filters = torch.cat([self.fixed_filters, self.filters], dim=-3)
+            original = self.parametrizations.filters.original
+            self.filters = torch.randn(
+                *original.shape[:-3],
+                n_filters,
+                *original.shape[-2:],
+                dtype=original.dtype,
+                device=original.device,
+            )
+        self.n_filters = self.fixed_filters.shape[-3] + n_filters
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """Adapt the fixed filters to the state dict before loading it."""
+        key = prefix + "fixed_filters"
+        original_key = prefix + "parametrizations.filters.original"
+        if key not in state_dict and original_key in state_dict:
+            # State dicts saved before fixed filters existed have none
+            original = state_dict[original_key]
+            state_dict[key] = original.new_empty(
+                *original.shape[:-3], 0, *original.shape[-2:]
+            )
+        if key in state_dict and state_dict[key].shape != self.fixed_filters.shape:
+            # Fixed filters added by `add_filters` before saving
+            self.fixed_filters = self.fixed_filters.new_empty(state_dict[key].shape)
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+        self.n_filters = (
+            self.fixed_filters.shape[-3]
+            + self.parametrizations.filters.original.shape[-3]
+        )
 
     #########################
     # PREPROCESSING
@@ -65,7 +144,7 @@ class AMAParent(ABC, nn.Module):
     #########################
 
     @abstractmethod
-    def responses(self, stimuli):
+    def responses(self, stimuli, preprocessed=False):
         """
         Compute the response to each stimulus.
 
@@ -73,6 +152,9 @@ class AMAParent(ABC, nn.Module):
         ----------
         stimuli : torch.Tensor
             Stimulus tensor of shape (n_stim, n_channels, n_dim).
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
 
         Returns
         -------
@@ -81,7 +163,7 @@ class AMAParent(ABC, nn.Module):
         """
         pass
 
-    def log_likelihoods(self, stimuli):
+    def log_likelihoods(self, stimuli, preprocessed=False):
         """
         Compute the log-likelihood of each class for each stimulus.
 
@@ -89,17 +171,45 @@ class AMAParent(ABC, nn.Module):
         ----------
         stimuli : torch.Tensor
             Stimulus tensor of shape (n_stim, n_channels, n_dim).
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
 
         Returns
         -------
         torch.Tensor
             Log-likelihoods tensor of shape (n_stim, n_classes).
         """
-        responses = self.responses(stimuli=stimuli)
-        log_likelihoods = self.responses_2_log_likelihoods(responses)
+        # Normalize the filters once, for the responses and their statistics
+        with cached():
+            responses = self.responses(stimuli=stimuli, preprocessed=preprocessed)
+            log_likelihoods = self.responses_2_log_likelihoods(responses)
         return log_likelihoods
 
-    def posteriors(self, stimuli):
+    def log_posteriors(self, stimuli, preprocessed=False):
+        """
+        Compute the log-posterior of each class for each stimulus.
+
+        Parameters
+        ----------
+        stimuli : torch.Tensor
+            Stimulus tensor of shape (n_stim, n_channels, n_dim).
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
+
+        Returns
+        -------
+        torch.Tensor
+            Log-posteriors tensor of shape (n_stim, n_classes).
+        """
+        log_likelihoods = self.log_likelihoods(
+            stimuli=stimuli, preprocessed=preprocessed
+        )
+        log_posteriors = self.log_likelihoods_2_log_posteriors(log_likelihoods)
+        return log_posteriors
+
+    def posteriors(self, stimuli, preprocessed=False):
         """
         Compute the posterior of each class for each stimulus.
 
@@ -107,17 +217,22 @@ class AMAParent(ABC, nn.Module):
         ----------
         stimuli : torch.Tensor
             Stimulus tensor of shape (n_stim, n_channels, n_dim).
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
 
         Returns
         -------
         torch.Tensor
             Posteriors tensor of shape (n_stim, n_classes).
         """
-        log_likelihoods = self.log_likelihoods(stimuli=stimuli)
+        log_likelihoods = self.log_likelihoods(
+            stimuli=stimuli, preprocessed=preprocessed
+        )
         posteriors = self.log_likelihoods_2_posteriors(log_likelihoods)
         return posteriors
 
-    def estimates(self, stimuli):
+    def estimates(self, stimuli, preprocessed=False):
         """
         Compute latent variable estimates for each stimulus.
 
@@ -125,16 +240,158 @@ class AMAParent(ABC, nn.Module):
         ----------
         stimuli : torch.Tensor
             Stimulus tensor of shape (n_stim, n_channels, n_dim).
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
 
         Returns
         -------
         torch.Tensor
             Estimates tensor of shape (n_stim).
         """
-        posteriors = self.posteriors(stimuli=stimuli)
+        posteriors = self.posteriors(stimuli=stimuli, preprocessed=preprocessed)
         estimates = self.posteriors_2_estimates(posteriors=posteriors)
         return estimates
 
+    def batched_inference(
+        self,
+        stimuli,
+        outputs=("posteriors",),
+        batch_size=None,
+        memory_budget=None,
+        preprocessed=False,
+        stream=False,
+    ):
+        """
+        Compute inference outputs for many stimuli, in batches.
+
+        The stimuli are processed in batches under `torch.inference_mode`,
+        and each requested output is computed once per batch.
+
+        Parameters
+        ----------
+        stimuli : torch.Tensor or iterable
+            Stimulus tensor of shape (n_stim, n_channels, n_dim), or an
+            iterable of such tensors (e.g. chunks read from disk).
+        outputs : tuple of str, optional
+            Outputs to compute, among "responses", "log_likelihoods",
+            "log_posteriors", "posteriors" and "estimates",
+            by default ("posteriors",).
+        batch_size : int, optional
+            Maximum number of stimuli per batch. If None, it is chosen so
+            that the intermediate tensors of a batch fit in `memory_budget`,
+            by default None.
+        memory_budget : int, optional
+            Approximate memory available for the intermediate tensors of
+            each batch, in bytes, by default `DEFAULT_MEMORY_BUDGET`.
+        preprocessed : bool, optional
+            If True, `stimuli` have already been processed with `preprocess`
+            and preprocessing is skipped, by default False.
+        stream : bool, optional
+            If True, return a generator that yields the outputs of each
+            batch instead of concatenating them, by default False.
+
+        Returns
+        -------
+        dict or generator
+            Dictionary with a tensor of shape (n_stim, ...) for each
+            requested output (with n_stim = 0 if there are no stimuli), or,
+            if `stream` is True, a generator of such dictionaries for each
+            batch.
+        """
+        if len(outputs) == 0:
+            raise ValueError(
+                f"No outputs requested. Available outputs are {INFERENCE_OUTPUTS}."
+            )
+        for output in outputs:
+            if output not in INFERENCE_OUTPUTS:
+                raise ValueError(
+                    f"Unknown output '{output}'. "
+                    f"Available outputs are {INFERENCE_OUTPUTS}."
+                )
+        if batch_size is None:
+            batch_size = self._inference_batch_size(memory_budget)
+        if isinstance(stimuli, torch.Tensor):
+            stimuli = (stimuli,)
+
+        batch_outputs = self._batched_inference(
+            stimuli, outputs, batch_size, preprocessed
+        )
+        if stream:
+            return batch_outputs
+        # Normalize the filters once for all the batches
+        with cached():
+            batch_outputs = list(batch_outputs)
+        if not batch_outputs:
+            # No stimuli: outputs of an empty batch of preprocessed stimuli
+            filters_original = self.parametrizations.filters.original
+            empty_stimuli = filters_original.new_empty(0, *filters_original.shape[-2:])
+            with torch.inference_mode():
+                batch_outputs = [
+                    self._inference_outputs(empty_stimuli, outputs, preprocessed=True)
+                ]
+        return {
+            output: torch.cat(
+                [batch[output] for batch in batch_outputs], dim=self._stimulus_dim
+            )
+            for output in outputs
+        }
+
+    def _batched_inference(self, stimuli, outputs, batch_size, preprocessed):
+        for chunk in stimuli:
+            for batch in chunk.split(batch_size):
+                with torch.inference_mode():
+                    batch_outputs = self._inference_outputs(
+                        batch, outputs, preprocessed
+                    )
+                yield batch_outputs
+
+    def _inference_outputs(self, stimuli, outputs, preprocessed):
+        """Compute the requested outputs, going only as far as needed."""
+        last_stage = max(INFERENCE_OUTPUTS.index(output) for output in outputs)
+        results = {}
+        with cached():
+            results["responses"] = self.responses(stimuli, preprocessed=preprocessed)
+            if last_stage >= 1:
+                results["log_likelihoods"] = self.responses_2_log_likelihoods(
+                    results["responses"]
+                )
+        if last_stage >= 2:
+            results["log_posteriors"] = self.log_likelihoods_2_log_posteriors(
+                results["log_likelihoods"]
+            )
+        if last_stage >= 3:
+            results["posteriors"] = self.log_likelihoods_2_posteriors(
+                results["log_likelihoods"]
+            )
+        if last_stage >= 4:
+            results["estimates"] = self.posteriors_2_estimates(results["posteriors"])
+        return {output: results[output] for output in outputs}
+
+    @property
+    def _stimulus_dim(self):
+        """Dimension of the stimuli in the outputs, after any model dimensions."""
+        return self.parametrizations.filters.original.dim() - 3
+
+    def _inference_batch_size(self, memory_budget=None):
+        """Number of stimuli whose inference intermediates fit in `memory_budget`."""
+        if memory_budget is None:
+            memory_budget = DEFAULT_MEMORY_BUDGET
+        n_classes = self.priors.shape[0]
+        # Shapes of the unconstrained filters, without evaluating the constraint
+        filters_original = self.parametrizations.filters.original
+        n_channels, n_dim = filters_original.shape[-2:]
+        n_filters = self.n_filters
+        n_models = filters_original.shape[:-3].numel()
+        # Preprocessed stimuli, and for each model the responses, per-class
+        # distances and whitened distances, and the (log-)likelihoods and
+        # posteriors of each class
+        elements_per_stimulus = n_channels * n_dim + n_models * (
+            n_filters + 2 * n_classes * n_filters + 4 * n_classes
+        )
+        bytes_per_stimulus = elements_per_stimulus * filters_original.element_size()
+        return max(1, int(memory_budget // bytes_per_stimulus))
+
     @abstractmethod
     def responses_2_log_likelihoods(self, responses):
         """
@@ -169,6 +426,25 @@ class AMAParent(ABC, nn.Module):
         posteriors = tfun.softmax(log_likelihoods + torch.log(self.priors), dim=-1)
         return posteriors
 
+    def log_likelihoods_2_log_posteriors(self, log_likelihoods):
+        """
+        Compute the log-posterior of each class given the log-likelihoods.
+
+        Parameters
+        ----------
+        log_likelihoods : torch.Tensor
+            Log-likelihoods tensor of shape (n_stim, n_classes).
+
+        Returns
+        -------
+        torch.Tensor
+            Log-posteriors tensor of shape (n_stim, n_classes).
+        """
+        log_posteriors = tfun.log_softmax(
+            log_likelihoods + torch.log(self.priors), dim=-1
+        )
+        return log_posteriors
+
     def posteriors_2_estimates(self, posteriors):
         """
         Convert posterior probabilities to estimates of the latent variable.
@@ -2,12 +2,28 @@ import torch.nn as nn
 
 
 class BuffersDict(nn.Module):
-    def __init__(self, stats_dict=None):
+    def __init__(self, stats_dict=None, dtype=None):
         super().__init__()
+        # If given, the buffers keep this dtype through `to`, `float`, etc.
+        self.dtype = dtype
         if stats_dict is not None:
             for name, tensor in stats_dict.items():
                 self.register_buffer(name, tensor)
 
+    def _apply(self, fn, recurse=True):
+        if self.dtype is None:
+            return super()._apply(fn, recurse)
+
+        def apply_pinned(tensor):
+            # Find the effect of `fn` on an empty tensor, to only move the
+            # buffers without casting them (and losing precision)
+            result = fn(tensor.new_empty(0))
+            if result.dtype == tensor.dtype:
+                return fn(tensor)
+            return tensor.to(device=result.device)
+
+        return super()._apply(apply_pinned, recurse)
+
     def __getitem__(self, key):
         if key in self._buffers:
             return self._buffers[key]
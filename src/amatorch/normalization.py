@@ -17,18 +17,18 @@ def unit_norm(stimuli, c50=torch.as_tensor(0)):
     Parameters
     ----------
     stimuli : torch.Tensor
-        Stimuli tensor of shape (n_stim, n_channels, n_dim).
+        Stimuli tensor of shape (..., n_stim, n_channels, n_dim).
     c50 : torch.Tensor, optional
         Offset constant added to the sum of squares, by default `torch.as_tensor(0)`.
 
     Returns
     -------
     torch.Tensor
-        Normalized stimuli tensor of shape (n_stim, n_channels, n_dim).
+        Normalized stimuli tensor of shape (..., n_stim, n_channels, n_dim).
     """
     # Normalizing factor
     normalizing_factor = torch.sqrt(torch.sum(stimuli**2, dim=(-2, -1)) + c50)
-    return stimuli / normalizing_factor[:, None, None]
+    return stimuli / normalizing_factor[..., None, None]
 
 
 def unit_norm_channels(stimuli, c50=torch.as_tensor(0)):
@@ -1,17 +1,35 @@
+import os
+import tempfile
 import time
 
+import numpy as np
 import torch
+import torch.nn.functional as tfun
 from torch import optim
 from torch.utils.data import DataLoader, TensorDataset
 from tqdm import tqdm
 
-__all__ = ["fit"]
+from amatorch import inference
+
+__all__ = [
+    "fit",
+    "fit_incremental",
+    "fit_coarse_to_fine",
+    "fit_lbfgs",
+    "fit_statistics",
+    "preprocess_stimuli",
+    "TensorBatchLoader",
+]
 
 
 def __dir__():
     return __all__
 
 
+# Version of the checkpoint files written by `fit`
+CHECKPOINT_FORMAT_VERSION = 1
+
+
 def fit(
     model,
     stimuli,
@@ -22,6 +40,16 @@ def fit(
     learning_rate=0.1,
     decay_step=1000,
     decay_rate=1,
+    preprocessed=False,
+    loader="dataloader",
+    progress=True,
+    log_interval=1,
+    callback=None,
+    tolerance=None,
+    patience=1,
+    checkpoint_path=None,
+    checkpoint_interval=1,
+    resume=False,
 ):
     """
     Learn AMA filters using Gradient Descent.
@@ -47,17 +75,71 @@ def fit(
         Number of steps to decay the learning rate, by default 1000.
     decay_rate : float, optional
         Learning rate decay factor, by default 1.
+    preprocessed : bool, optional
+        If True, `stimuli` have already been processed with `model.preprocess`
+        (e.g. with `preprocess_stimuli`), and `loss_fun` is called with
+        `preprocessed=True` so that preprocessing is not repeated every
+        epoch, by default False.
+    loader : str, optional
+        How minibatches are drawn, by default "dataloader".
+        - "dataloader": `torch.utils.data.DataLoader` over a `TensorDataset`.
+        - "tensor": `TensorBatchLoader`, which draws one permutation per
+            epoch and gathers each batch with a single `index_select`.
+    progress : bool, optional
+        Whether to show progress bars and print the loss, by default True.
+    log_interval : int, optional
+        Number of epochs between loss reports. The loss stays on the model
+        device between reports, avoiding a host synchronization every
+        epoch. If None, the loss is only synchronized at the end,
+        by default 1.
+    callback : callable, optional
+        Function called at every loss report with a dictionary with keys
+        'epoch', 'loss', 'loss_change' (change since the previous epoch) and
+        'time' (total training time), by default None.
+    tolerance : float, optional
+        If given, training stops early when the epoch loss changes by less
+        than `tolerance` for `patience` consecutive epochs. The loss is then
+        synchronized every epoch, by default None.
+    patience : int, optional
+        Number of consecutive epochs below `tolerance` before stopping,
+        by default 1.
+    checkpoint_path : str or os.PathLike, optional
+        If given, the state of the model, optimizer, scheduler and random
+        number generator, and the loss and time so far, are saved to this
+        file every `checkpoint_interval` epochs and at the end of training,
+        by default None.
+    checkpoint_interval : int, optional
+        Number of epochs between checkpoints, by default 1.
+    resume : bool, optional
+        If True and `checkpoint_path` exists, training resumes from the
+        checkpoint and continues until `epochs` epochs in total (or until it
+        stops early), giving the same result as an uninterrupted run. If the
+        checkpointed run had already stopped early, its results are returned
+        without training, by default False.
 
     Returns
     -------
     torch.Tensor
-        Tensor containing the loss at each epoch (shape: epochs).
+        Tensor containing the loss at each epoch (shape: epochs), or of each
+        model at each epoch for an ensemble (shape: epochs, n_models). It
+        includes the epochs before resuming, and is shorter than `epochs`
+        if training stopped early.
     torch.Tensor
         Tensor containing the training time at each epoch (shape: epochs).
     """
     # Create data loader
-    dataset = TensorDataset(stimuli, labels)
-    data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    if loader == "dataloader":
+        dataset = TensorDataset(stimuli, labels)
+        data_loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    elif loader == "tensor":
+        data_loader = TensorBatchLoader(
+            stimuli, labels, batch_size=batch_size, reuse_buffers=True
+        )
+    else:
+        raise ValueError(
+            f"Unknown loader '{loader}'. Available loaders are "
+            "'dataloader' and 'tensor'."
+        )
     n_batches = len(data_loader)
 
     if loss_fun is None:
@@ -72,45 +154,738 @@ def fit(
 
     loss = []
     training_time = []
-    total_start_time = time.time()
-    prev_loss = None
+    start_epoch = 0
+    stalled_epochs = 0
+    converged = False
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        checkpoint = _load_checkpoint(checkpoint_path)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        scheduler.load_state_dict(checkpoint["scheduler"])
+        torch.set_rng_state(checkpoint["rng_state"])
+        loss = list(checkpoint["loss"].to(model.priors.device))
+        training_time = checkpoint["training_time"].tolist()
+        start_epoch = checkpoint["epoch"]
+        stalled_epochs = checkpoint.get("stalled_epochs", 0)
+        converged = checkpoint.get("converged", False)
+    # A run that stopped early is not continued
+    if converged:
+        return _stack_losses(loss), torch.as_tensor(training_time)
+
+    total_start_time = time.time() - sum(training_time)
 
-    for e in tqdm(range(epochs), desc="Epochs", unit="epoch"):
+    epoch_iterator = range(start_epoch, epochs)
+    if progress:
+        epoch_iterator = tqdm(
+            epoch_iterator,
+            desc="Epochs",
+            unit="epoch",
+            initial=start_epoch,
+            total=epochs,
+        )
+
+    for e in epoch_iterator:
         epoch_start_time = time.time()
         running_loss = 0.0
 
-        for batch_stimuli, batch_labels in tqdm(
-            data_loader, desc=f"Epoch {e+1}/{epochs}", unit="batch", leave=False
-        ):
+        batch_iterator = data_loader
+        if progress:
+            batch_iterator = tqdm(
+                data_loader, desc=f"Epoch {e + 1}/{epochs}", unit="batch", leave=False
+            )
 
+        for batch_stimuli, batch_labels in batch_iterator:
             optimizer.zero_grad()
-            batch_loss = loss_fun(model, batch_stimuli, batch_labels)
-            batch_loss.backward()
+            if preprocessed:
+                batch_loss = loss_fun(
+                    model, batch_stimuli, batch_labels, preprocessed=True
+                )
+            else:
+                batch_loss = loss_fun(model, batch_stimuli, batch_labels)
+            # The models of an ensemble have independent parameters, so the
+            # gradient of the summed loss is the gradient of each model's loss
+            batch_loss.sum().backward()
             optimizer.step()
-            running_loss += batch_loss.detach().item()
+            # Accumulate on the device, without synchronizing
+            running_loss += batch_loss.detach()
 
         scheduler.step()
 
         epoch_time = time.time() - epoch_start_time
         training_time.append(epoch_time)
-        current_loss = running_loss / n_batches
+        loss.append(running_loss / n_batches)
+
+        if tolerance is not None and len(loss) > 1:
+            loss_change = torch.max(torch.abs(loss[-1] - loss[-2])).item()
+            stalled_epochs = stalled_epochs + 1 if loss_change < tolerance else 0
+        converged = stalled_epochs >= patience
+
+        if _is_report_epoch(e, epochs, log_interval) or converged:
+            _report_loss(
+                unit="epoch",
+                epoch=e,
+                epochs=epochs,
+                loss=loss,
+                total_time=time.time() - total_start_time,
+                progress=progress,
+                callback=callback,
+            )
+
+        if checkpoint_path is not None and (
+            (e + 1) % checkpoint_interval == 0 or e + 1 == epochs or converged
+        ):
+            _save_checkpoint(
+                checkpoint_path,
+                {
+                    "model": model.state_dict(),
+                    "optimizer": optimizer.state_dict(),
+                    "scheduler": scheduler.state_dict(),
+                    "rng_state": torch.get_rng_state(),
+                    "loss": _stack_losses(loss),
+                    "training_time": torch.as_tensor(training_time),
+                    "epoch": e + 1,
+                    "stalled_epochs": stalled_epochs,
+                    "converged": converged,
+                },
+            )
+
+        if converged:
+            break
+
+    return _stack_losses(loss), torch.as_tensor(training_time)
+
+
+def _save_checkpoint(path, checkpoint):
+    """Save a training checkpoint, replacing any previous one atomically."""
+    checkpoint = {**checkpoint, "format_version": CHECKPOINT_FORMAT_VERSION}
+    directory = os.path.dirname(os.path.abspath(path))
+    # Write to a temporary file first, so that an interruption never leaves
+    # a partially written checkpoint
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temp_file:
+        torch.save(checkpoint, temp_file)
+    os.replace(temp_file.name, path)
+
+
+def _load_checkpoint(path):
+    """Load a training checkpoint saved by `fit`."""
+    checkpoint = torch.load(path, map_location="cpu")
+    format_version = checkpoint.pop("format_version", None)
+    if format_version != CHECKPOINT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported checkpoint format version {format_version} in '{path}'."
+        )
+    return checkpoint
+
+
+def fit_incremental(model, stimuli, labels, n_stages, filters_per_stage=2, **kwargs):
+    """
+    Learn AMA filters in stages, freezing the filters of previous stages.
+
+    The first stage trains the current filters of the model. Each of the
+    following stages freezes the trained filters with `model.add_filters`
+    and trains `filters_per_stage` new filters. The response statistics of
+    the frozen filters are computed once per stage, so each stage only
+    computes the statistics of the filters that it trains.
+
+    Parameters
+    ----------
+    model : AMA model object
+        The model used for fitting.
+    stimuli : torch.Tensor
+        Stimuli tensor of shape (n_stim, n_channels, n_dim).
+    labels : torch.Tensor
+        Label tensor of shape (n_stim).
+    n_stages : int
+        Number of training stages.
+    filters_per_stage : int, optional
+        Number of filters added at each stage after the first, by default 2.
+    **kwargs
+        Other arguments passed to `fit` at every stage (e.g. 'epochs').
+
+    Returns
+    -------
+    torch.Tensor
+        Tensor containing the loss at each epoch of each stage
+        (shape: n_stages * epochs).
+    torch.Tensor
+        Tensor containing the training time at each epoch of each stage
+        (shape: n_stages * epochs).
+    """
+    loss = []
+    training_time = []
+    for stage in range(n_stages):
+        if stage > 0:
+            model.add_filters(filters_per_stage)
+        stage_loss, stage_time = fit(model, stimuli, labels, **kwargs)
+        loss.append(stage_loss)
+        training_time.append(stage_time)
+    return torch.cat(loss), torch.cat(training_time)
+
+
+def fit_coarse_to_fine(model, stimuli, labels, n_levels=3, factor=2, **kwargs):
+    """
+    Learn AMA filters from coarse to fine stimulus resolution.
+
+    The stimuli are downsampled along their spatial dimension by
+    `factor ** (n_levels - 1)`, and an AMAGauss model with the settings of
+    `model` (covariance rank and pooling, principal components, dtypes,
+    log-likelihood method) is trained on them. Its filters are then
+    upsampled by `factor` to initialize the filters of the next level, and
+    so on until the filters of `model` are trained on the full resolution
+    stimuli.
+
+    Downsampling averages blocks of `factor` samples (zero-padding the
+    last block) and scales them by `sqrt(factor)`, and upsampling repeats
+    each filter sample `factor` times and divides it by `sqrt(factor)`.
+    Upsampling is the adjoint of downsampling, so the upsampled filters
+    keep their norm and their responses to the stimuli. With principal
+    components, the filters are upsampled in the space of the stimuli (see
+    `AMAGauss.stimulus_filters`) and projected on the components of the
+    next level, and each level keeps at most as many components as its
+    downsampled stimuli have dimensions.
+
+    Parameters
+    ----------
+    model : AMAGauss
+        The model to fit, at full resolution. It must not have fixed filters.
+    stimuli : torch.Tensor
+        Stimuli tensor of shape (n_stim, n_channels, n_dim).
+    labels : torch.Tensor
+        Label tensor of shape (n_stim).
+    n_levels : int, optional
+        Number of resolution levels, including the full resolution,
+        by default 3.
+    factor : int, optional
+        Downsampling factor between consecutive levels, by default 2.
+    **kwargs
+        Other arguments passed to `fit` at every level (e.g. 'epochs').
+
+    Returns
+    -------
+    torch.Tensor
+        Tensor containing the loss at each epoch of each level, from the
+        coarsest to the finest (shape: n_levels * epochs).
+    torch.Tensor
+        Tensor containing the training time at each epoch of each level
+        (shape: n_levels * epochs).
+    """
+    # Imported here, since the models don't depend on the optimization
+    from amatorch.models import AMAGauss
+
+    if model.fixed_filters.shape[-3] > 0:
+        raise ValueError(
+            "Coarse-to-fine training requires a model without fixed filters."
+        )
+    n_channels = stimuli.shape[-2]
+    filters_original = model.parametrizations.filters.original
+    statistics = model.stimulus_statistics
+    if "factors" in statistics:
+        covariance_rank = statistics["factors"].shape[-1]
+        shared_covariance = statistics["factors"].shape[0] == 1
+    else:
+        covariance_rank = None
+        shared_covariance = statistics["covariances"].shape[0] == 1
+    n_components = None if model.components is None else model.components.shape[-1]
+
+    loss = []
+    training_time = []
+    filters = None
+    for level in reversed(range(n_levels)):
+        scale = factor**level
+        if level == 0:
+            level_model, level_stimuli = model, stimuli
+        else:
+            level_stimuli = _downsample(stimuli, scale)
+            level_model = AMAGauss(
+                stimuli=level_stimuli,
+                labels=labels,
+                n_filters=model.n_filters,
+                priors=model.priors.clone(),
+                response_noise=model.response_noise.clone(),
+                c50=model.c50.clone(),
+                device=filters_original.device,
+                dtype=filters_original.dtype,
+                log_likelihood_method=model.log_likelihood_method,
+                log_likelihood_chunk_size=model.log_likelihood_chunk_size,
+                covariance_rank=covariance_rank,
+                shared_covariance=shared_covariance,
+                n_components=None
+                if n_components is None
+                else min(n_components, n_channels * level_stimuli.shape[-1]),
+                whiten=model.whiten,
+                statistics_dtype=statistics.dtype,
+            )
+        if filters is not None:
+            # Initialize with the filters of the previous (coarser) level
+            filters = _upsample(filters, factor)[..., : level_stimuli.shape[-1]]
+            level_model.filters = _project_filters(filters, level_model.components)
+        level_loss, level_time = fit(level_model, level_stimuli, labels, **kwargs)
+        loss.append(level_loss)
+        training_time.append(level_time)
+        filters = level_model.stimulus_filters.detach()
+    return torch.cat(loss), torch.cat(training_time)
+
+
+def _downsample(stimuli, scale):
+    """Average blocks of `scale` samples, preserving the energy."""
+    n_padding = -stimuli.shape[-1] % scale
+    stimuli = tfun.pad(stimuli, (0, n_padding))
+    return tfun.avg_pool1d(stimuli, scale) * np.sqrt(scale)
+
+
+def _upsample(filters, scale):
+    """Repeat each sample `scale` times, the adjoint of `_downsample`."""
+    return torch.repeat_interleave(filters, scale, dim=-1) / np.sqrt(scale)
+
+
+def _project_filters(filters, components):
+    """Least-squares coordinates of stimulus filters on principal components."""
+    if components is None:
+        return filters
+    components = components.flatten(0, 1).to(filters.dtype)
+    coordinates = filters.flatten(-2, -1) @ torch.linalg.pinv(components).mT
+    return coordinates.unsqueeze(-2)
+
+
+# Maximum number of loss evaluations of each L-BFGS iteration
+MAX_LINE_SEARCH_EVALUATIONS = 25
+
+
+def fit_lbfgs(
+    model,
+    stimuli,
+    labels,
+    max_iterations=100,
+    loss_fun=None,
+    tolerance=1e-6,
+    history_size=100,
+    batch_size=None,
+    preprocessed=False,
+    progress=True,
+    log_interval=1,
+    callback=None,
+):
+    """
+    Learn AMA filters with full-batch L-BFGS.
+
+    Every iteration evaluates the loss and its gradient on all the stimuli
+    and takes a quasi-Newton step with a strong Wolfe line search. The loss
+    does not depend on the norm of the unconstrained filter parameters (the
+    filters are normalized by the `Sphere` parametrization), so after each
+    step the parameters are rescaled back onto the unit sphere, which keeps
+    the problem well conditioned. This retraction is a heuristic: the
+    curvature pairs stored by L-BFGS are not transported to the rescaled
+    parameters, so the Hessian approximation is only approximately valid
+    after each step. Training stops when the loss changes by less than
+    `tolerance` between iterations.
+
+    Ensembles (e.g. `AMAGaussEnsemble`) are not supported, since the
+    shared line search and Hessian approximation would couple their models.
+    Train them with `fit` instead.
+
+    Parameters
+    ----------
+    model : AMA model object
+        The model used for fitting, with a single set of filters.
+    stimuli : torch.Tensor
+        Stimuli tensor of shape (n_stim, n_channels, n_dim).
+    labels : torch.Tensor
+        Label tensor of shape (n_stim).
+    max_iterations : int, optional
+        Maximum number of L-BFGS iterations, by default 100.
+    loss_fun : callable, optional
+        Loss function that takes in model, stimuli, labels and
+        `preprocessed`, by default the negative log posterior at the true
+        category (cross-entropy).
+    tolerance : float, optional
+        Training stops when the loss changes by less than this value
+        between iterations, by default 1e-6.
+    history_size : int, optional
+        Number of past updates used to approximate the Hessian,
+        by default 100.
+    batch_size : int, optional
+        If given, the full-batch loss and gradient are accumulated over
+        chunks of this many stimuli, to bound memory, by default None.
+    preprocessed : bool, optional
+        If True, `stimuli` have already been processed with `model.preprocess`.
+        Otherwise they are preprocessed once before training, by default False.
+    progress : bool, optional
+        Whether to show a progress bar and print the loss, by default True.
+    log_interval : int, optional
+        Number of iterations between loss reports. If None, the loss is not
+        reported, by default 1.
+    callback : callable, optional
+        Function called at every loss report with a dictionary with keys
+        'iteration', 'loss', 'loss_change' (change since the previous iteration) and
+        'time' (total training time), by default None.
+
+    Returns
+    -------
+    torch.Tensor
+        Tensor containing the loss at the start of each iteration
+        (shape: n_iterations).
+    torch.Tensor
+        Tensor containing the training time of each iteration
+        (shape: n_iterations).
+    """
+    filters_original = model.parametrizations.filters.original
+    if filters_original.dim() > 3:
+        raise ValueError(
+            "fit_lbfgs doesn't support ensembles of models, whose line search "
+            "and Hessian approximation would be shared. Use `fit` instead."
+        )
+    if loss_fun is None:
+        loss_fun = kl_loss
+    if not preprocessed:
+        stimuli = preprocess_stimuli(model, stimuli)
+    if batch_size is None:
+        batch_size = stimuli.shape[0]
+    n_stimuli = stimuli.shape[0]
+
+    # One iteration per step, so that the filters are retracted after each
+    optimizer = optim.LBFGS(
+        model.parameters(),
+        max_iter=1,
+        max_eval=MAX_LINE_SEARCH_EVALUATIONS,
+        history_size=history_size,
+        line_search_fn="strong_wolfe",
+    )
+
+    def closure():
+        optimizer.zero_grad()
+        total_loss = 0.0
+        for batch_stimuli, batch_labels in zip(
+            stimuli.split(batch_size), labels.split(batch_size)
+        ):
+            batch_loss = loss_fun(
+                model, batch_stimuli, batch_labels, preprocessed=True
+            ) * (batch_stimuli.shape[0] / n_stimuli)
+            batch_loss.backward()
+            total_loss = total_loss + batch_loss.detach()
+        return total_loss
+
+    loss = []
+    training_time = []
+    total_start_time = time.time()
+
+    iterator = range(max_iterations)
+    if progress:
+        iterator = tqdm(iterator, desc="Iterations", unit="iteration")
+
+    with torch.no_grad():
+        _normalize_filters(filters_original)
+    for iteration in iterator:
+        iteration_start_time = time.time()
+
+        # Loss at the start of the iteration, evaluated by the optimizer
+        iteration_loss = optimizer.step(closure)
+        # Retract onto the sphere, where the loss is unchanged
+        with torch.no_grad():
+            _normalize_filters(filters_original)
+
+        training_time.append(time.time() - iteration_start_time)
+        loss.append(iteration_loss)
+
+        converged = len(loss) > 1 and torch.abs(loss[-1] - loss[-2]).item() < tolerance
+        if _is_report_epoch(iteration, max_iterations, log_interval) or converged:
+            _report_loss(
+                unit="iteration",
+                epoch=iteration,
+                epochs=max_iterations,
+                loss=loss,
+                total_time=time.time() - total_start_time,
+                progress=progress,
+                callback=callback,
+            )
+        if converged:
+            break
+
+    return _stack_losses(loss), torch.as_tensor(training_time)
+
+
+def _normalize_filters(filters_original):
+    """Rescale the unconstrained filter parameters to unit norm, in place."""
+    filters_original.div_(
+        torch.sqrt(torch.sum(filters_original**2, dim=(-2, -1), keepdim=True))
+    )
+
+
+def fit_statistics(
+    model,
+    steps,
+    n_samples=256,
+    learning_rate=0.1,
+    decay_step=1000,
+    decay_rate=1,
+    generator=None,
+    progress=True,
+    log_interval=None,
+    callback=None,
+):
+    """
+    Learn AMA filters from the stored class statistics, without stimuli.
+
+    The loss is the expected negative log posterior at the true class when
+    the responses follow the class-conditional Gaussian distributions of
+    the model (`model.response_factors`), estimated with `n_samples`
+    samples per class drawn at every step. The cost of a step depends on
+    the number of classes and dimensions, but not on the number of stimuli.
+
+    Parameters
+    ----------
+    model : AMAGauss
+        The model used for fitting.
+    steps : int
+        Number of optimization steps.
+    n_samples : int, optional
+        Number of response samples per class at each step, by default 256.
+    learning_rate : float, optional
+        Initial learning rate, by default 0.1.
+    decay_step : int, optional
+        Number of steps to decay the learning rate, by default 1000.
+    decay_rate : float, optional
+        Learning rate decay factor, by default 1.
+    generator : torch.Generator, optional
+        Random number generator for the response samples, by default None.
+    progress : bool, optional
+        Whether to show progress bars and print the loss, by default True.
+    log_interval : int, optional
+        Number of steps between loss reports. The loss stays on the model
+        device between reports, avoiding a host synchronization every
+        step. If None, the loss is only synchronized at the end,
+        by default None.
+    callback : callable, optional
+        Function called at every loss report with a dictionary with keys
+        'step', 'loss', 'loss_change' (change since the previous step) and
+        'time' (total training time), by default None.
+
+    Returns
+    -------
+    torch.Tensor
+        Tensor containing the loss at each step (shape: steps), or of each
+        model at each step for an ensemble (shape: steps, n_models).
+    torch.Tensor
+        Tensor containing the training time at each step (shape: steps).
+    """
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    scheduler = torch.optim.lr_scheduler.StepLR(
+        optimizer, step_size=decay_step, gamma=decay_rate
+    )
+
+    loss = []
+    training_time = []
+    total_start_time = time.time()
+
+    step_iterator = range(steps)
+    if progress:
+        step_iterator = tqdm(step_iterator, desc="Steps", unit="step")
+
+    for step in step_iterator:
+        step_start_time = time.time()
+
+        optimizer.zero_grad()
+        step_loss = statistics_kl_loss(model, n_samples, generator=generator)
+        step_loss.sum().backward()
+        optimizer.step()
+        scheduler.step()
+
+        training_time.append(time.time() - step_start_time)
+        loss.append(step_loss.detach())
+
+        if _is_report_epoch(step, steps, log_interval):
+            _report_loss(
+                unit="step",
+                epoch=step,
+                epochs=steps,
+                loss=loss,
+                total_time=time.time() - total_start_time,
+                progress=progress,
+                callback=callback,
+            )
+
+    return _stack_losses(loss), torch.as_tensor(training_time)
 
-        loss_change = 0.0 if prev_loss is None else current_loss - prev_loss
 
-        loss.append(current_loss)
-        prev_loss = current_loss
-        total_time = time.time() - total_start_time
+def _is_report_epoch(epoch, epochs, log_interval):
+    """Whether the loss is reported after `epoch` (0-indexed)."""
+    if log_interval is None:
+        return False
+    return (epoch + 1) % log_interval == 0 or epoch + 1 == epochs
 
-        # Update tqdm bar description with loss change and total time
+
+def _stack_losses(loss):
+    """Stack the losses of each epoch on the CPU, also if there are none."""
+    if not loss:
+        return torch.empty(0)
+    return torch.stack(loss).cpu()
+
+
+def _report_loss(unit, epoch, epochs, loss, total_time, progress, callback):
+    """Print the last loss in `loss` and its change since the previous epoch."""
+    # Mean over the models of an ensemble
+    current_loss = loss[-1].mean().item()
+    loss_change = 0.0 if len(loss) < 2 else current_loss - loss[-2].mean().item()
+
+    if progress:
         tqdm.write(
-            f"Epoch {e+1}/{epochs}, Loss: {current_loss:.4f}, "
+            f"{unit.capitalize()} {epoch + 1}/{epochs}, Loss: {current_loss:.4f}, "
             + f"Change: {loss_change:.4f}, Time: {total_time:.2f}s"
         )
+    if callback is not None:
+        callback(
+            {
+                unit: epoch + 1,
+                "loss": current_loss,
+                "loss_change": loss_change,
+                "time": total_time,
+            }
+        )
+    return current_loss
+
+
+class TensorBatchLoader:
+    """
+    Iterate over shuffled minibatches of tensors that share the first dimension.
+
+    Each epoch draws a single random permutation, and each batch gathers
+    the samples of a contiguous slice of the permutation with a single
+    `index_select` per tensor. This avoids collating every batch from
+    per-sample indexing, as `torch.utils.data.DataLoader` does, and never
+    copies more than a batch, so memory-mapped or shared tensors (e.g.
+    the preprocessed stimuli of `preprocess_stimuli`) are not copied into
+    private memory.
+    """
+
+    def __init__(
+        self,
+        *tensors,
+        batch_size=512,
+        shuffle=True,
+        generator=None,
+        reuse_buffers=False,
+        pin_memory=False,
+    ):
+        """
+        Initialize the loader.
+
+        Parameters
+        ----------
+        *tensors : torch.Tensor
+            Tensors to iterate over, with the same size in the first dimension.
+        batch_size : int, optional
+            Batch size, by default 512.
+        shuffle : bool, optional
+            Whether to shuffle the tensors at every epoch, by default True.
+        generator : torch.Generator, optional
+            Random number generator for the permutations, by default None.
+        reuse_buffers : bool, optional
+            If True, the batches are gathered into batch-sized buffers that
+            are allocated once and overwritten by every batch. A batch must
+            then not be kept after the next one is drawn, by default False.
+        pin_memory : bool, optional
+            If True, the batches are gathered in pinned memory, for faster
+            transfers to an accelerator, by default False.
+        """
+        if len({tensor.shape[0] for tensor in tensors}) != 1:
+            raise ValueError("All tensors must have the same size in dimension 0.")
+        self.tensors = tensors
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+        self.reuse_buffers = reuse_buffers
+        self.pin_memory = pin_memory
+        self._buffers = None
+
+    def __len__(self):
+        n_samples = self.tensors[0].shape[0]
+        return (n_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        n_samples = self.tensors[0].shape[0]
+        if not self.shuffle:
+            for start in range(0, n_samples, self.batch_size):
+                yield tuple(
+                    tensor[start : start + self.batch_size] for tensor in self.tensors
+                )
+            return
+
+        indices = torch.randperm(n_samples, generator=self.generator)
+        for start in range(0, n_samples, self.batch_size):
+            yield self._gather(indices[start : start + self.batch_size])
+
+    def _gather(self, batch_indices):
+        if not (self.reuse_buffers or self.pin_memory):
+            return tuple(
+                tensor[batch_indices.to(tensor.device)] for tensor in self.tensors
+            )
+
+        buffers = self._buffers
+        if buffers is None:
+            buffers = [self._new_buffer(tensor) for tensor in self.tensors]
+            if self.reuse_buffers:
+                self._buffers = buffers
+        # The last batch may be smaller than the buffers
+        buffers = [buffer[: batch_indices.shape[0]] for buffer in buffers]
+        for tensor, buffer in zip(self.tensors, buffers):
+            torch.index_select(tensor, 0, batch_indices.to(tensor.device), out=buffer)
+        return tuple(buffers)
+
+    def _new_buffer(self, tensor):
+        return torch.empty(
+            (min(self.batch_size, tensor.shape[0]),) + tensor.shape[1:],
+            dtype=tensor.dtype,
+            device=tensor.device,
+            pin_memory=self.pin_memory,
+        )
+
+
+def preprocess_stimuli(model, stimuli, batch_size=4096, filename=None, dtype=None):
+    """
+    Preprocess the stimuli once, to train with `fit(..., preprocessed=True)`.
+
+    Parameters
+    ----------
+    model : AMA model object
+        The model whose `preprocess` method is applied.
+    stimuli : torch.Tensor
+        Stimuli tensor of shape (n_stim, n_channels, n_dim).
+    batch_size : int, optional
+        Number of stimuli preprocessed at a time, by default 4096.
+    filename : str or os.PathLike, optional
+        If given, the preprocessed stimuli are written to a memory-mapped
+        file at this location instead of being kept in memory,
+        by default None.
+    dtype : torch.dtype, optional
+        If given, each batch of stimuli is cast to this dtype (e.g. the
+        dtype of the model) before being preprocessed, by default None
+        (the dtype of `stimuli`).
 
-    return torch.as_tensor(loss), torch.as_tensor(training_time)
+    Returns
+    -------
+    torch.Tensor
+        Preprocessed stimuli. If `filename` is given, the tensor shares
+        memory with the memory-mapped file.
+    """
+    with torch.no_grad():
+        first_batch = model.preprocess(stimuli[:batch_size].to(dtype))
+        shape = (stimuli.shape[0],) + tuple(first_batch.shape[1:])
+        if filename is None:
+            stimuli_processed = torch.empty(
+                shape, dtype=first_batch.dtype, device=first_batch.device
+            )
+        else:
+            np_dtype = torch.empty(0, dtype=first_batch.dtype).numpy().dtype
+            stimuli_processed = torch.from_numpy(
+                np.memmap(filename, dtype=np_dtype, mode="w+", shape=shape)
+            )
+        stimuli_processed[:batch_size] = first_batch
+        for start in range(batch_size, stimuli.shape[0], batch_size):
+            batch = slice(start, start + batch_size)
+            stimuli_processed[batch] = model.preprocess(stimuli[batch].to(dtype))
+    return stimuli_processed
 
 
-def kl_loss(model, stimuli, labels):
+def kl_loss(model, stimuli, labels, preprocessed=False):
     """
     Compute the negative log-likelihood loss (KL loss) for the AMA model.
 
@@ -122,14 +897,70 @@ def kl_loss(model, stimuli, labels):
         Input stimuli tensor of shape (batch_size, n_features).
     labels : torch.Tensor
         True category labels for the stimuli as a vector of category indices.
+    preprocessed : bool, optional
+        If True, `stimuli` have already been preprocessed, by default False.
 
     Returns
     -------
     torch.Tensor
-        Negative log-likelihood loss.
+        Negative log-likelihood loss, with shape (n_models) for an ensemble.
     """
-    n_stimuli = stimuli.shape[0]
-    log_posteriors = torch.log(model.posteriors(stimuli) + 1e-8)
-    correct_log_posteriors = log_posteriors[torch.arange(n_stimuli), labels]
-    loss = -torch.mean(correct_log_posteriors)
+    log_likelihoods = model.log_likelihoods(stimuli, preprocessed=preprocessed)
+    # Log-posterior at the true class only, without normalizing every class:
+    # log p(c|x) = log p(x|c) + log p(c) - logsumexp_j(log p(x|j) + log p(j))
+    log_joints = log_likelihoods + torch.log(model.priors)
+    labels = labels.unsqueeze(-1).expand(*log_joints.shape[:-1], 1)
+    correct_log_joints = torch.gather(log_joints, -1, labels).squeeze(-1)
+    correct_log_posteriors = correct_log_joints - torch.logsumexp(log_joints, dim=-1)
+    loss = -torch.mean(correct_log_posteriors, dim=-1)
+    return loss
+
+
+def statistics_kl_loss(model, n_samples, generator=None):
+    """
+    Compute the expected negative log posterior at the true class for
+    responses sampled from the class-conditional response distributions.
+
+    Parameters
+    ----------
+    model : AMAGauss
+        The model used for loss computation.
+    n_samples : int
+        Number of response samples per class.
+    generator : torch.Generator, optional
+        Random number generator for the response samples, by default None.
+
+    Returns
+    -------
+    torch.Tensor
+        Expected negative log posterior, weighting classes by their prior,
+        with shape (n_models) for an ensemble.
+    """
+    factors = model.response_factors
+    means = factors["means"]
+    *model_shape, n_classes, n_filters = means.shape
+
+    # Sample responses of each class with the reparametrization trick
+    white_noise = torch.randn(
+        *model_shape,
+        n_classes,
+        n_samples,
+        n_filters,
+        generator=generator,
+        dtype=means.dtype,
+        device=means.device,
+    )
+    samples = means.unsqueeze(-2) + torch.einsum(
+        "...ckj,...cmj->...cmk", factors["cholesky"], white_noise
+    )
+
+    log_likelihoods = inference.factorized_gaussian_log_likelihoods(
+        samples.flatten(-3, -2), **factors, method=model.log_likelihood_method
+    )
+    log_posteriors = model.log_likelihoods_2_log_posteriors(log_likelihoods).reshape(
+        *model_shape, n_classes, n_samples, n_classes
+    )
+
+    correct_log_posteriors = torch.diagonal(log_posteriors, dim1=-3, dim2=-1)
+    loss = -torch.sum(model.priors * torch.mean(correct_log_posteriors, dim=-2), dim=-1)
     return loss
@@ -0,0 +1,310 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import torch
+import torch.multiprocessing as mp
+
+from amatorch import optim
+from amatorch.models import AMAGauss
+
+__all__ = ["parallel_inference", "fit_sweep"]
+
+
+def __dir__():
+    return __all__
+
+
+# Number of tasks per worker, to balance the load between workers
+TASKS_PER_WORKER = 4
+
+# Model and stimuli of each worker process, set by `_init_worker`
+_worker_state = {}
+
+
+def parallel_inference(
+    model,
+    stimuli,
+    outputs=("posteriors",),
+    n_workers=None,
+    backend="process",
+    threads_per_worker=1,
+    batch_size=None,
+    memory_budget=None,
+    preprocessed=False,
+):
+    """
+    Compute inference outputs for many stimuli in parallel on CPU cores.
+
+    The stimuli are split into contiguous shards that are evaluated by a
+    pool of workers with `model.batched_inference`, and the outputs are
+    concatenated in the order of the stimuli. With the "process" backend
+    the workers are forked from the main process, so they share the
+    memory of the model (filters, stimulus statistics and cached response
+    statistics) and of the stimuli without copying or pickling them.
+    This backend requires the "fork" start method (e.g. Linux).
+
+    Parameters
+    ----------
+    model : AMA model object
+        The model used for inference.
+    stimuli : torch.Tensor
+        Stimulus tensor of shape (n_stim, n_channels, n_dim).
+    outputs : tuple of str, optional
+        Outputs to compute, see `AMAParent.batched_inference`,
+        by default ("posteriors",).
+    n_workers : int, optional
+        Number of workers, by default the number of CPU cores divided by
+        `threads_per_worker`.
+    backend : str, optional
+        Either "process" (a pool of processes) or "thread" (a pool of
+        threads in this process), by default "process".
+    threads_per_worker : int, optional
+        Number of PyTorch intra-op threads of each worker process,
+        by default 1.
+    batch_size : int, optional
+        Maximum number of stimuli per batch in each worker, by default None.
+        See `AMAParent.batched_inference`.
+    memory_budget : int, optional
+        Approximate memory available for each batch of each worker, in bytes,
+        by default None. See `AMAParent.batched_inference`.
+    preprocessed : bool, optional
+        If True, `stimuli` have already been processed with `model.preprocess`,
+        by default False.
+
+    Returns
+    -------
+    dict
+        Dictionary with a tensor of shape (n_stim, ...) for each requested
+        output.
+    """
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    n_stimuli = stimuli.shape[0]
+    shard_size = max(1, -(-n_stimuli // (n_workers * TASKS_PER_WORKER)))
+    shards = [
+        (start, min(start + shard_size, n_stimuli))
+        for start in range(0, n_stimuli, shard_size)
+    ]
+    inference_kwargs = {
+        "outputs": outputs,
+        "batch_size": batch_size,
+        "memory_budget": memory_budget,
+        "preprocessed": preprocessed,
+    }
+
+    # Compute any cached model state once, before the workers share it
+    model.batched_inference(stimuli[:1], **inference_kwargs)
+
+    if backend == "thread":
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = list(
+                executor.map(
+                    lambda shard: model.batched_inference(
+                        stimuli[shard[0] : shard[1]], **inference_kwargs
+                    ),
+                    shards,
+                )
+            )
+    elif backend == "process":
+        # Forked workers inherit the arguments of the initializer, so the
+        # parametrized model (which can't be pickled) is not serialized
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=mp.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(model, stimuli, threads_per_worker, inference_kwargs),
+        ) as executor:
+            results = list(executor.map(_evaluate_shard, shards))
+    else:
+        raise ValueError(
+            f"Unknown backend '{backend}'. Available backends are "
+            "'process' and 'thread'."
+        )
+
+    return {
+        output: torch.cat(
+            [result[output] for result in results], dim=model._stimulus_dim
+        )
+        for output in outputs
+    }
+
+
+def fit_sweep(
+    configs,
+    stimuli,
+    labels,
+    fit_kwargs=None,
+    n_workers=None,
+    threads_per_worker=1,
+    results_path=None,
+    preprocessed_dir=None,
+):
+    """
+    Fit many independent AMAGauss models in parallel worker processes.
+
+    The configurations are grouped by their preprocessing settings (`c50`,
+    `n_components`, `whiten` and `dtype`), and the groups are fitted one
+    after the other. The stimulus statistics and the preprocessed stimuli
+    of a group are computed once, shared by all the models of the group,
+    and released before the next group, so a single preprocessed copy of
+    the stimuli exists at a time. The workers are forked from the main
+    process, so they share the stimuli and statistics without copying or
+    pickling them (requires the "fork" start method, e.g. Linux).
+
+    Parameters
+    ----------
+    configs : list of dict
+        Configuration of each model. Each dictionary may contain a 'seed'
+        for the random initialization of the filters (by default the
+        index of the configuration), a 'c50' (by default 0.0), and any
+        other argument of `AMAGauss` (e.g. 'n_filters', 'response_noise',
+        'n_components', 'dtype'). The models are trained on CPU, since
+        forked workers can't use CUDA, so a 'device' must be "cpu".
+    stimuli : torch.Tensor
+        Stimulus tensor of shape (n_stim, n_channels, n_dim).
+    labels : torch.Tensor
+        Label tensor of shape (n_stim).
+    fit_kwargs : dict, optional
+        Arguments passed to `optim.fit` for every model (e.g. 'epochs',
+        'batch_size', 'learning_rate'), by default None (the defaults of
+        `optim.fit`).
+    n_workers : int, optional
+        Number of worker processes, by default the number of CPU cores
+        divided by `threads_per_worker`.
+    threads_per_worker : int, optional
+        Number of PyTorch intra-op threads of each worker, by default 1.
+    results_path : str or os.PathLike, optional
+        If given, the results are also saved to this file with `torch.save`,
+        by default None.
+    preprocessed_dir : str or os.PathLike, optional
+        If given, the preprocessed stimuli of each group are written to a
+        memory-mapped file in this directory (see `optim.preprocess_stimuli`)
+        instead of being kept in memory, by default None.
+
+    Returns
+    -------
+    dict
+        A dictionary containing, in the order of `configs`:
+        - 'configs': list of dict, the configuration of each model.
+        - 'loss': list of torch.Tensor, the loss curve of each model.
+        - 'training_time': list of torch.Tensor, the time of each epoch.
+        - 'filters': list of torch.Tensor, the final filters of each model,
+            in the space of its principal components if it has any.
+        - 'stimulus_filters': list of torch.Tensor, the final filters of
+            each model in the space of the stimuli (see
+            `AMAGauss.stimulus_filters`).
+    """
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+    fit_kwargs = fit_kwargs or {}
+    configs = [
+        {"seed": index, "c50": 0.0, **config} for index, config in enumerate(configs)
+    ]
+
+    # Indices of the configurations that share the preprocessed stimuli
+    groups = {}
+    for index, config in enumerate(configs):
+        if torch.device(config.get("device", "cpu")).type != "cpu":
+            raise ValueError(
+                f"Configuration {index} has device '{config['device']}', but "
+                "fit_sweep trains the models on CPU."
+            )
+        key = (
+            float(config["c50"]),
+            config.get("n_components"),
+            bool(config.get("whiten", False)),
+            config.get("dtype", torch.float32),
+        )
+        groups.setdefault(key, []).append(index)
+
+    fits = [None] * len(configs)
+    for group_index, ((c50, n_components, whiten, dtype), indices) in enumerate(
+        groups.items()
+    ):
+        statistics = AMAGauss.accumulate_statistics([(stimuli, labels)], c50=c50)
+        # The models of the group compute the same principal components
+        model = AMAGauss.from_statistics(
+            statistics,
+            n_filters=1,
+            n_components=n_components,
+            whiten=whiten,
+            dtype=dtype,
+        )
+        filename = None
+        if preprocessed_dir is not None:
+            filename = os.path.join(preprocessed_dir, f"stimuli_{group_index}.dat")
+        shared_data = {
+            "statistics": statistics,
+            "stimuli": optim.preprocess_stimuli(
+                model, stimuli, filename=filename, dtype=dtype
+            ),
+        }
+
+        with ProcessPoolExecutor(
+            max_workers=min(n_workers, len(indices)),
+            mp_context=mp.get_context("fork"),
+            initializer=_init_sweep_worker,
+            initargs=(shared_data, labels, fit_kwargs, threads_per_worker),
+        ) as executor:
+            group_configs = [configs[index] for index in indices]
+            for index, fit in zip(indices, executor.map(_fit_config, group_configs)):
+                fits[index] = fit
+        # Release the preprocessed stimuli before the next group
+        del shared_data
+
+    results = {
+        "configs": configs,
+        "loss": [fit["loss"] for fit in fits],
+        "training_time": [fit["training_time"] for fit in fits],
+        "filters": [fit["filters"] for fit in fits],
+        "stimulus_filters": [fit["stimulus_filters"] for fit in fits],
+    }
+    if results_path is not None:
+        torch.save(results, results_path)
+    return results
+
+
+def _init_worker(model, stimuli, threads_per_worker, inference_kwargs):
+    torch.set_num_threads(threads_per_worker)
+    _worker_state["model"] = model
+    _worker_state["stimuli"] = stimuli
+    _worker_state["inference_kwargs"] = inference_kwargs
+
+
+def _evaluate_shard(shard):
+    start, stop = shard
+    model = _worker_state["model"]
+    stimuli = _worker_state["stimuli"][start:stop]
+    return model.batched_inference(stimuli, **_worker_state["inference_kwargs"])
+
+
+def _init_sweep_worker(shared_data, labels, fit_kwargs, threads_per_worker):
+    torch.set_num_threads(threads_per_worker)
+    _worker_state["shared_data"] = shared_data
+    _worker_state["labels"] = labels
+    _worker_state["fit_kwargs"] = fit_kwargs
+
+
+def _fit_config(config):
+    model_kwargs = dict(config)
+    seed = model_kwargs.pop("seed")
+    model_kwargs.pop("c50")
+    shared_data = _worker_state["shared_data"]
+
+    torch.manual_seed(seed)
+    model = AMAGauss.from_statistics(shared_data["statistics"], **model_kwargs)
+    loss, training_time = optim.fit(
+        model=model,
+        stimuli=shared_data["stimuli"],
+        labels=_worker_state["labels"],
+        preprocessed=True,
+        progress=False,
+        log_interval=None,
+        **_worker_state["fit_kwargs"],
+    )
+    return {
+        "loss": loss,
+        "training_time": training_time,
+        "filters": model.all_filters.detach().clone(),
+        "stimulus_filters": model.stimulus_filters.detach().clone(),
+    }
@@ -1,6 +1,21 @@
+from importlib import resources
+from pathlib import Path
+
+import pytest
 import torch
 
-from amatorch.datasets import disparity_data, disparity_filters
+from amatorch.datasets import (
+    clear_cache,
+    convert_csv_to_npy,
+    disparity_data,
+    disparity_filters,
+    load_data,
+    load_dataset,
+    load_filters,
+    register_dataset,
+    registered_datasets,
+    registry,
+)
 
 
 def test_disparity_data_loading():
@@ -23,3 +38,68 @@ def test_disparity_filter_loading():
 
     assert isinstance(filters, torch.Tensor)
     assert filters.dim() == 3
+
+
+def test_binary_data_loading(tmp_path):
+    """Test that data converted to .npy files loads the same as the .csv files."""
+    data_dir = resources.files("amatorch.datasets") / "disparity"
+    written = convert_csv_to_npy(data_dir, output_dir=tmp_path)
+    assert len(written) > 0
+
+    data_csv = load_data(data_dir)
+    data_npy = load_data(tmp_path)
+
+    for key in ("stimuli", "labels", "values"):
+        assert data_npy[key].dtype == data_csv[key].dtype
+        assert torch.equal(data_npy[key], data_csv[key]), f"{key} do not match"
+    assert torch.equal(load_filters(tmp_path), load_filters(data_dir))
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """On-disk cache directory, with the registry restored after the test."""
+    monkeypatch.setattr(registry, "_REGISTRY", dict(registry._REGISTRY))
+    monkeypatch.setattr(registry, "_cache_dir", tmp_path / "cache")
+    yield tmp_path / "cache"
+    clear_cache("disparity_copy")
+
+
+def test_dataset_registry(cache_dir, monkeypatch):
+    """Test that registered datasets are loaded once and cached on disk."""
+    data_dir = resources.files("amatorch.datasets") / "disparity"
+    disparity = disparity_data()
+    register_dataset("disparity_copy", data_dir=data_dir, stimulus_shape=(2, 26))
+    assert "disparity_copy" in registered_datasets()
+
+    data = load_dataset("disparity_copy")
+    assert data["stimuli"].shape[1:] == (2, 26)
+    assert torch.equal(data["stimuli"], disparity["stimuli"])
+    # Read once per process, then memory-mapped at every load, without
+    # sharing the tensors between loads
+    sources = registry._MEMORY_CACHE[("dataset", "disparity_copy")]
+    assert all(isinstance(source, Path) for source in sources.values())
+    with monkeypatch.context() as patch:
+        patch.setattr(registry, "_read_dataset", None)
+        data_again = load_dataset("disparity_copy")
+    assert data_again["stimuli"].data_ptr() != data["stimuli"].data_ptr()
+    # Registering a dataset only drops that dataset from memory
+    assert ("dataset", "disparity") in registry._MEMORY_CACHE
+    # Parsed .csv files are cached on disk
+    assert len(list((cache_dir / "disparity_copy").glob("*.npy"))) == 3
+
+    clear_cache()
+    data_cached = load_dataset("disparity_copy")
+    assert torch.equal(data_cached["labels"], data["labels"])
+
+    with pytest.raises(ValueError):
+        register_dataset("disparity_copy", data_dir=data_dir, stimulus_shape=(52,))
+
+
+def test_dataset_copies():
+    """Test that modifying loaded tensors doesn't affect later loads."""
+    data = disparity_data()
+    stimuli = data["stimuli"].clone()
+    data["stimuli"].zero_()
+    disparity_filters().zero_()
+    assert torch.equal(disparity_data()["stimuli"], stimuli)
+    assert torch.any(disparity_filters() != 0)
@@ -5,7 +5,7 @@ import pytest
 import torch
 
 from amatorch.datasets import disparity_data, disparity_filters
-from amatorch.models import AMAGauss
+from amatorch.models import AMAGauss, AMAGaussEnsemble
 
 @pytest.fixture(scope="module")
 def data():
@@ -39,3 +39,56 @@ def test_to_dtype(data, filters):
 
     assert posteriors.dtype == torch.float64, "Posteriors are not float64"
     assert responses.dtype == torch.float64, "Responses are not float64"
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16])
+def test_statistics_dtype(data, filters, dtype):
+    """Test that the statistics keep their dtype when the model is cast."""
+    stimuli = data["stimuli"].double()
+    ama_ref = AMAGauss(
+        stimuli=stimuli,
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=0.005,
+        dtype=torch.float64,
+    ).double()
+    ama_ref.filters = filters.double()
+    ama = AMAGauss(
+        stimuli=stimuli,
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=0.005,
+        statistics_dtype=torch.float64,
+    ).to(dtype)
+    ama.filters = filters.to(dtype)
+
+    assert ama.filters.dtype == dtype
+    assert ama.stimulus_statistics["covariances"].dtype == torch.float64
+    assert ama.response_factors["cholesky"].dtype == torch.float64
+    assert ama.responses(stimuli.to(dtype)).dtype == dtype
+
+    posteriors = ama.posteriors(stimuli.to(dtype))
+    assert posteriors.dtype == torch.float64
+    if dtype == torch.float32:
+        assert torch.allclose(posteriors, ama_ref.posteriors(stimuli), atol=1e-3)
+    estimates = ama.posteriors_2_estimates(posteriors)
+    agreement = torch.mean((estimates == ama_ref.estimates(stimuli)).double())
+    assert agreement > 0.95
+
+
+@pytest.mark.parametrize("model_class", [AMAGauss, AMAGaussEnsemble])
+def test_init_dtype(data, model_class):
+    """Test that the parameters and buffers are created with `dtype`."""
+    ama = model_class(
+        stimuli=data["stimuli"].double(),
+        labels=data["labels"],
+        n_filters=2,
+        dtype=torch.float64,
+    )
+    tensors = dict(ama.named_parameters())
+    tensors.update(ama.named_buffers())
+    for name, tensor in tensors.items():
+        assert tensor.dtype == torch.float64, f"{name} is {tensor.dtype}"
+        assert tensor.device.type == "cpu"
+    assert ama.filters.dtype == torch.float64
+    assert ama.posteriors(data["stimuli"].double()).dtype == torch.float64
@@ -4,6 +4,8 @@ import numpy as np
 import pytest
 import torch
 
+import amatorch.inference as inference
+import amatorch.optim as optim
 from amatorch.datasets import disparity_data, disparity_filters
 from amatorch.models import AMAGauss
 
@@ -124,3 +126,321 @@ def test_ama_gauss_inference(
     assert (
         torch.sum(estimates != estimates_ref) < 15
     ), "Estimates are not close to reference"
+
+
+def test_response_factors_cache(data, filters):
+    """Test that the factorized response statistics are reused while
+    the filters are fixed and recomputed when they change."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+    )
+    ama.filters = filters
+
+    with torch.no_grad():
+        factors = ama.response_factors
+        assert ama.response_factors is factors, "Factors were not cached"
+
+        ama.filters = torch.flip(filters, dims=(0,))
+        new_factors = ama.response_factors
+        assert new_factors is not factors, "Cache was not invalidated"
+
+        response_statistics = ama.response_statistics
+        covariances = new_factors["cholesky"] @ new_factors["cholesky"].transpose(
+            -2, -1
+        )
+        assert torch.allclose(
+            covariances, response_statistics["covariances"], atol=1e-6
+        ), "Cholesky factors do not match the response covariances"
+
+
+def test_response_factors_inference_mode(data, filters):
+    """Test that models created or cast under inference mode can be
+    evaluated, inside and after the inference mode block."""
+    stimuli = data["stimuli"][:50]
+    with torch.inference_mode():
+        ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+        posteriors = ama.posteriors(stimuli)
+    # Inference tensors can't be saved for backward, outside the block too
+    with torch.no_grad():
+        assert torch.allclose(ama.posteriors(stimuli), posteriors)
+
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    ama.filters = filters
+    with torch.inference_mode():
+        ama.double()
+        posteriors = ama.posteriors(stimuli.double())
+    with torch.no_grad():
+        assert torch.allclose(ama.posteriors(stimuli.double()), posteriors)
+
+
+def test_ama_gauss_from_batches(data):
+    """Test that a model initialized from batches of stimuli has the same
+    stimulus statistics as a model initialized from the full dataset."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        c50=0.5,
+    )
+    batches = zip(data["stimuli"].split(1000), data["labels"].split(1000))
+    ama_batches = AMAGauss.from_batches(batches, n_filters=2, c50=0.5)
+    assert ama_batches.c50 == 0.5, "c50 was not set"
+
+    for name in ("means", "covariances"):
+        assert torch.allclose(
+            ama.stimulus_statistics[name],
+            ama_batches.stimulus_statistics[name],
+            atol=1e-6,
+        ), f"Stimulus {name} from batches do not match"
+
+
+def test_ama_gauss_statistics_file(data, tmp_path):
+    """Test that saved stimulus statistics can be used to initialize
+    models with different hyperparameters."""
+    statistics = AMAGauss.accumulate_statistics(
+        [(data["stimuli"], data["labels"])], c50=0.5
+    )
+    path = tmp_path / "statistics.pt"
+    AMAGauss.save_statistics(statistics, path)
+    statistics_loaded = AMAGauss.load_statistics(path)
+
+    ama = AMAGauss.from_statistics(statistics_loaded, n_filters=4, response_noise=0.1)
+
+    assert ama.filters.shape == (4,) + data["stimuli"].shape[1:]
+    assert ama.c50 == 0.5, "c50 was not loaded"
+    assert torch.equal(statistics_loaded["counts"], statistics["counts"])
+    with pytest.raises(ValueError):
+        AMAGauss.from_statistics(statistics_loaded, c50=0.1)
+
+
+def test_ama_gauss_low_rank_statistics_file(data, tmp_path):
+    """Test that low-rank stimulus statistics can be accumulated, saved
+    and loaded."""
+    statistics = AMAGauss.accumulate_statistics(
+        zip(data["stimuli"].split(1000), data["labels"].split(1000)),
+        c50=0.5,
+        covariance_rank=4,
+    )
+    assert "covariances" not in statistics
+    path = tmp_path / "statistics.pt"
+    AMAGauss.save_statistics(statistics, path)
+    statistics_loaded = AMAGauss.load_statistics(path)
+
+    for name in ("means", "factors", "diagonals", "counts"):
+        assert torch.equal(statistics_loaded[name], statistics[name])
+    ama = AMAGauss.from_statistics(statistics_loaded, n_filters=2)
+    assert ama.stimulus_statistics["factors"].shape[-1] == 4
+
+
+def test_ama_gauss_log_posteriors(data, filters):
+    """Test that log-posteriors and the fused loss are consistent with
+    the posteriors."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+    )
+    ama.filters = filters
+
+    with torch.no_grad():
+        log_posteriors = ama.log_posteriors(data["stimuli"])
+        posteriors = ama.posteriors(data["stimuli"])
+        loss = optim.kl_loss(ama, data["stimuli"], data["labels"])
+
+    assert torch.allclose(torch.exp(log_posteriors), posteriors, atol=1e-6)
+    correct_log_posteriors = log_posteriors[
+        torch.arange(data["labels"].shape[0]), data["labels"]
+    ]
+    assert torch.allclose(loss, -torch.mean(correct_log_posteriors))
+
+
+def test_ama_gauss_batched_inference(data, filters):
+    """Test that batched inference matches inference on the full dataset."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+    )
+    ama.filters = filters
+    outputs = ("responses", "log_likelihoods", "posteriors", "estimates")
+
+    with torch.no_grad():
+        responses = ama.responses(data["stimuli"])
+        log_likelihoods = ama.log_likelihoods(data["stimuli"])
+        posteriors = ama.posteriors(data["stimuli"])
+
+    results = ama.batched_inference(data["stimuli"], outputs=outputs, batch_size=1000)
+    streamed = list(
+        ama.batched_inference(
+            data["stimuli"].split(3000), outputs=("estimates",), stream=True
+        )
+    )
+
+    assert set(results) == set(outputs)
+    assert torch.allclose(results["responses"], responses, atol=1e-6)
+    assert torch.allclose(results["log_likelihoods"], log_likelihoods, atol=1e-4)
+    assert torch.allclose(results["posteriors"], posteriors, atol=1e-6)
+    assert torch.equal(
+        torch.cat([batch["estimates"] for batch in streamed]), results["estimates"]
+    )
+
+
+def test_filters_normalized_once(data, filters):
+    """Test that the filters are normalized once per evaluation."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+    )
+    ama.filters = filters
+    n_normalizations = []
+    ama.parametrizations.filters[0].register_forward_hook(
+        lambda *args: n_normalizations.append(1)
+    )
+
+    optim.kl_loss(ama, data["stimuli"][:100], data["labels"][:100]).backward()
+    assert len(n_normalizations) == 1
+
+    n_normalizations.clear()
+    ama.batched_inference(data["stimuli"], outputs=("estimates",), batch_size=100)
+    assert len(n_normalizations) == 1
+
+    # The normalized filters are not reused after they change
+    ama.filters = filters.flip(-1)
+    with torch.no_grad():
+        responses = ama.responses(data["stimuli"])
+    results = ama.batched_inference(data["stimuli"], outputs=("responses",))
+    assert torch.allclose(results["responses"], responses)
+
+
+def test_ama_gauss_low_rank_covariances(data, filters):
+    """Test that full rank low-rank covariances match the full covariances."""
+    n_dim = data["stimuli"].shape[1] * data["stimuli"].shape[2]
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+    )
+    ama_low_rank = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        covariance_rank=n_dim,
+    )
+    ama.filters = filters
+    ama_low_rank.filters = filters
+
+    assert "covariances" not in ama_low_rank.stimulus_statistics
+    assert ama_low_rank.stimulus_statistics["factors"].shape[-1] == n_dim
+    assert torch.allclose(
+        ama_low_rank.response_statistics["covariances"],
+        ama.response_statistics["covariances"],
+        atol=1e-5,
+    )
+
+
+def test_ama_gauss_shared_covariance(data, filters):
+    """Test that the shared covariance path matches the per-class path."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        shared_covariance=True,
+    )
+    ama.filters = filters
+    factors = ama.response_factors
+    assert factors["cholesky"].shape == (1, 2, 2)
+
+    n_classes = factors["means"].shape[0]
+    expanded_factors = {
+        "means": factors["means"],
+        "cholesky": factors["cholesky"].expand(n_classes, -1, -1),
+        "log_determinants": factors["log_determinants"].expand(n_classes),
+    }
+    responses = ama.responses(data["stimuli"])
+    log_likelihoods = inference.factorized_gaussian_log_likelihoods(
+        responses, **factors
+    )
+    for method in ("cholesky", "quadratic"):
+        log_likelihoods_ref = inference.factorized_gaussian_log_likelihoods(
+            responses, **expanded_factors, method=method
+        )
+        assert torch.allclose(log_likelihoods, log_likelihoods_ref, atol=1e-4)
+    assert torch.allclose(ama.log_likelihoods(data["stimuli"]), log_likelihoods)
+
+
+@pytest.mark.parametrize("source", ["stimuli", "statistics"])
+def test_ama_gauss_principal_components(data, filters, source):
+    """Test that filters learned on all the principal components match."""
+    stimuli = data["stimuli"].double()
+    n_dim = stimuli.shape[1] * stimuli.shape[2]
+    ama = AMAGauss(
+        stimuli=stimuli, labels=data["labels"], n_filters=2, dtype=torch.float64
+    ).double()
+    if source == "stimuli":
+        ama_pca = AMAGauss(
+            stimuli=stimuli,
+            labels=data["labels"],
+            n_filters=2,
+            n_components=n_dim,
+            dtype=torch.float64,
+        )
+    else:
+        statistics = AMAGauss.accumulate_statistics([(stimuli, data["labels"])])
+        ama_pca = AMAGauss.from_statistics(
+            statistics, n_filters=2, n_components=n_dim, dtype=torch.float64
+        )
+    ama_pca = ama_pca.double()
+    ama.filters = filters.double()
+    components = ama_pca.components.flatten(0, 1)
+    ama_pca.filters = (ama.filters.flatten(-2, -1) @ components).unsqueeze(-2)
+
+    assert ama_pca.filters.shape == (2, 1, n_dim)
+    assert torch.allclose(ama_pca.stimulus_filters, ama.filters)
+    assert torch.allclose(
+        ama_pca.log_likelihoods(stimuli), ama.log_likelihoods(stimuli)
+    )
+
+
+def test_ama_gauss_unknown_log_likelihood_method(data):
+    """Test that unsupported log-likelihood methods are rejected at
+    initialization."""
+    with pytest.raises(ValueError, match="inverse"):
+        AMAGauss(
+            stimuli=data["stimuli"],
+            labels=data["labels"],
+            log_likelihood_method="inverse",
+        )
+
+
+def test_ama_gauss_log_likelihood_chunks(data, filters):
+    """Test that chunked log-likelihoods match the unchunked ones."""
+    log_likelihoods = {}
+    for chunk_size in (None, 100):
+        ama = AMAGauss(
+            stimuli=data["stimuli"],
+            labels=data["labels"],
+            n_filters=2,
+            log_likelihood_chunk_size=chunk_size,
+        )
+        ama.filters = filters
+        log_likelihoods[chunk_size] = ama.log_likelihoods(data["stimuli"])
+    assert torch.allclose(log_likelihoods[None], log_likelihoods[100])
+
+
+def test_ama_gauss_batched_inference_empty(data, filters):
+    """Test batched inference without outputs or without stimuli."""
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    ama.filters = filters
+    with pytest.raises(ValueError, match="No outputs"):
+        ama.batched_inference(data["stimuli"], outputs=())
+
+    n_classes = ama.priors.shape[0]
+    outputs = ("responses", "posteriors", "estimates")
+    for stimuli in (data["stimuli"][:0], []):
+        results = ama.batched_inference(stimuli, outputs=outputs)
+        assert results["responses"].shape == (0, 2)
+        assert results["posteriors"].shape == (0, n_classes)
+        assert results["estimates"].shape == (0,)
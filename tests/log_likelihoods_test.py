@@ -0,0 +1,88 @@
+import pytest
+import torch
+
+from amatorch import inference
+
+N_POINTS = 300
+N_CLASSES = 7
+N_DIM = 4
+
+
+@pytest.fixture(scope="module")
+def gaussians():
+    torch.manual_seed(0)
+    points = torch.randn(N_POINTS, N_DIM, dtype=torch.float64)
+    means = torch.randn(N_CLASSES, N_DIM, dtype=torch.float64)
+    factors = torch.randn(N_CLASSES, N_DIM, N_DIM, dtype=torch.float64)
+    covariances = factors @ factors.transpose(-2, -1) + 0.1 * torch.eye(
+        N_DIM, dtype=torch.float64
+    )
+    return points, means, covariances
+
+
+@pytest.mark.parametrize("method", ["cholesky", "quadratic"])
+@pytest.mark.parametrize("chunk_size", [None, 64])
+def test_log_likelihood_methods(gaussians, method, chunk_size):
+    """Test that the log-likelihood backends agree with the
+    explicit-inverse implementation."""
+    points, means, covariances = gaussians
+    log_likelihoods_ref = inference.gaussian_log_likelihoods(points, means, covariances)
+
+    log_likelihoods = inference.gaussian_log_likelihoods(
+        points, means, covariances, method=method, chunk_size=chunk_size
+    )
+
+    assert log_likelihoods.shape == (N_POINTS, N_CLASSES)
+    assert torch.allclose(log_likelihoods, log_likelihoods_ref), (
+        f"Log-likelihoods with method '{method}' do not match reference"
+    )
+
+
+def test_log_likelihood_unknown_method(gaussians):
+    points, means, covariances = gaussians
+    with pytest.raises(ValueError):
+        inference.gaussian_log_likelihoods(points, means, covariances, method="lu")
+    factors = inference.gaussian_factors(means, covariances)
+    with pytest.raises(ValueError, match=r"\('cholesky', 'quadratic'\)"):
+        inference.factorized_gaussian_log_likelihoods(
+            points, **factors, method="inverse"
+        )
+
+
+def test_cholesky_default_chunks(gaussians, monkeypatch):
+    """Test that the default "cholesky" chunks match a single chunk."""
+    points, means, covariances = gaussians
+    factors = inference.gaussian_factors(means, covariances)
+    log_likelihoods_ref = inference.factorized_gaussian_log_likelihoods(
+        points, **factors, chunk_size=N_POINTS
+    )
+    # Chunks of 10 points
+    monkeypatch.setattr(inference, "_WHITENED_CHUNK_ELEMENTS", 10 * N_CLASSES * N_DIM)
+    log_likelihoods = inference.factorized_gaussian_log_likelihoods(points, **factors)
+    assert torch.allclose(log_likelihoods, log_likelihoods_ref)
+
+
+def test_cholesky_default_chunks_batched(gaussians, monkeypatch):
+    """Test that the default "cholesky" chunks count the leading dimensions
+    of the means and points once."""
+    points, means, covariances = gaussians
+    n_models = 3
+    factors = inference.gaussian_factors(
+        means.expand(n_models, -1, -1), covariances.expand(n_models, -1, -1, -1)
+    )
+    chunk_sizes = []
+    chunked = inference._chunked
+
+    def record_chunked(function, points, chunk_size):
+        chunk_sizes.append(chunk_size)
+        return chunked(function, points, chunk_size)
+
+    monkeypatch.setattr(inference, "_chunked", record_chunked)
+    monkeypatch.setattr(
+        inference, "_WHITENED_CHUNK_ELEMENTS", 10 * n_models * N_CLASSES * N_DIM
+    )
+    log_likelihoods = inference.factorized_gaussian_log_likelihoods(
+        points.expand(n_models, -1, -1), **factors
+    )
+    assert chunk_sizes == [10]
+    assert log_likelihoods.shape == (n_models, N_POINTS, N_CLASSES)
@@ -0,0 +1,113 @@
+import pytest
+import torch
+
+from amatorch import optim, parallel
+from amatorch.datasets import disparity_data, disparity_filters
+from amatorch.models import AMAGauss
+
+
+@pytest.fixture(scope="module")
+def data():
+    return disparity_data()
+
+
+@pytest.fixture(scope="module")
+def filters():
+    return disparity_filters()
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_parallel_inference(data, filters, backend):
+    """Test that parallel inference matches serial inference, in order."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+    )
+    ama.filters = filters
+    outputs = ("log_likelihoods", "estimates")
+
+    serial = ama.batched_inference(data["stimuli"], outputs=outputs)
+    results = parallel.parallel_inference(
+        ama, data["stimuli"], outputs=outputs, n_workers=2, backend=backend
+    )
+
+    assert torch.allclose(results["log_likelihoods"], serial["log_likelihoods"])
+    assert torch.equal(results["estimates"], serial["estimates"])
+
+
+def test_fit_sweep(data, tmp_path):
+    """Test that a sweep reproduces independent fits, in order."""
+    configs = [
+        {"n_filters": 2, "response_noise": 0.01, "seed": 3},
+        {"n_filters": 1, "response_noise": 0.05, "c50": 0.5},
+    ]
+    fit_kwargs = {"epochs": 2, "batch_size": 1024, "loader": "tensor"}
+    results_path = tmp_path / "sweep.pt"
+
+    results = parallel.fit_sweep(
+        configs,
+        data["stimuli"],
+        data["labels"],
+        fit_kwargs=fit_kwargs,
+        n_workers=2,
+        results_path=results_path,
+        preprocessed_dir=tmp_path,
+    )
+
+    assert [config["seed"] for config in results["configs"]] == [3, 1]
+    assert results["filters"][1].shape == (1, *data["stimuli"].shape[1:])
+    assert torch.equal(torch.load(results_path)["loss"][0], results["loss"][0])
+    # One memory-mapped file of preprocessed stimuli per c50
+    assert len(list(tmp_path.glob("stimuli_*.dat"))) == 2
+
+    # Serial fit of the first configuration
+    torch.manual_seed(3)
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=0.01,
+    )
+    loss, _ = optim.fit(
+        ama, data["stimuli"], data["labels"], progress=False, **fit_kwargs
+    )
+    assert torch.allclose(results["loss"][0], loss, rtol=1e-4)
+    assert torch.allclose(results["filters"][0], ama.filters.detach(), atol=1e-4)
+
+
+def test_fit_sweep_components(data):
+    """Test a sweep over the number of principal components."""
+    configs = [
+        {"n_filters": 2, "n_components": 4},
+        {"n_filters": 2, "n_components": 6, "whiten": True},
+        {"n_filters": 2},
+    ]
+    fit_kwargs = {"epochs": 1, "batch_size": 1024, "loader": "tensor"}
+
+    results = parallel.fit_sweep(
+        configs, data["stimuli"], data["labels"], fit_kwargs=fit_kwargs, n_workers=2
+    )
+
+    assert results["filters"][0].shape == (2, 1, 4)
+    assert results["filters"][1].shape == (2, 1, 6)
+    assert results["filters"][2].shape == (2, *data["stimuli"].shape[1:])
+    for stimulus_filters in results["stimulus_filters"]:
+        assert stimulus_filters.shape == (2, *data["stimuli"].shape[1:])
+    assert torch.equal(results["stimulus_filters"][2], results["filters"][2])
+    assert all(torch.isfinite(loss).all() for loss in results["loss"])
+
+
+def test_fit_sweep_dtype(data):
+    """Test a sweep with models of different dtypes."""
+    configs = [{"n_filters": 2, "dtype": torch.float64}, {"n_filters": 2}]
+    fit_kwargs = {"epochs": 1, "batch_size": 1024, "loader": "tensor"}
+
+    results = parallel.fit_sweep(
+        configs, data["stimuli"], data["labels"], fit_kwargs=fit_kwargs, n_workers=2
+    )
+
+    assert results["filters"][0].dtype == torch.float64
+    assert results["filters"][1].dtype == torch.float32
+    with pytest.raises(ValueError):
+        parallel.fit_sweep([{"device": "cuda"}], data["stimuli"], data["labels"])
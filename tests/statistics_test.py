@@ -0,0 +1,146 @@
+import pytest
+import torch
+
+from amatorch import inference
+
+N_POINTS = 2000
+N_CLASSES = 6
+N_DIM = 5
+
+
+@pytest.fixture(scope="module")
+def points():
+    torch.manual_seed(0)
+    points = torch.randn(N_POINTS, N_DIM, dtype=torch.float64)
+    labels = torch.randint(0, N_CLASSES, (N_POINTS,))
+    weights = torch.rand(N_POINTS, dtype=torch.float64)
+    return points, labels, weights
+
+
+def test_class_statistics(points):
+    """Test that class statistics match the per-class torch statistics."""
+    points, labels, weights = points
+
+    statistics = inference.class_statistics(points, labels)
+    weighted_statistics = inference.class_statistics(points, labels, weights=weights)
+
+    assert statistics["means"].dtype == torch.float64
+    for c in range(N_CLASSES):
+        class_points = points[labels == c]
+        assert torch.allclose(statistics["means"][c], class_points.mean(dim=0))
+        assert torch.allclose(statistics["covariances"][c], torch.cov(class_points.t()))
+        assert torch.allclose(
+            weighted_statistics["covariances"][c],
+            torch.cov(class_points.t(), aweights=weights[labels == c]),
+        )
+
+
+def test_class_statistics_unbalanced(monkeypatch):
+    """Test that class statistics match the per-class torch statistics when
+    unbalanced classes are processed in several groups."""
+    torch.manual_seed(1)
+    n_dim = 40
+    labels = torch.cat([torch.zeros(500), torch.arange(1, 30).repeat(3)]).long()
+    points = torch.randn(labels.shape[0], n_dim, dtype=torch.float64)
+    # Budget of the padded points smaller than the largest class
+    monkeypatch.setattr(inference, "_PADDED_CLASSES_CHUNK_ELEMENTS", 0)
+    groups = inference._class_groups(torch.bincount(labels), n_dim, points.numel())
+    assert groups == [(0, 1), (1, 30)]
+
+    statistics = inference.class_statistics(points, labels)
+
+    for c in (0, 1, 29):
+        class_points = points[labels == c]
+        assert torch.allclose(statistics["covariances"][c], torch.cov(class_points.t()))
+
+
+def test_statistics_accumulator(points):
+    """Test that statistics accumulated over batches, including batches
+    missing some classes, match the statistics of the full dataset."""
+    points, labels, weights = points
+    statistics_ref = inference.class_statistics(points, labels, weights=weights)
+
+    accumulator = inference.ClassStatisticsAccumulator()
+    for start in range(0, N_POINTS // 2, 7):
+        batch = slice(start, min(start + 7, N_POINTS // 2))
+        accumulator.update(points[batch], labels[batch], weights=weights[batch])
+    other = inference.ClassStatisticsAccumulator().update(
+        points[N_POINTS // 2 :],
+        labels[N_POINTS // 2 :],
+        weights=weights[N_POINTS // 2 :],
+    )
+    statistics = accumulator.merge(other).statistics()
+
+    assert torch.allclose(statistics["means"], statistics_ref["means"])
+    assert torch.allclose(statistics["covariances"], statistics_ref["covariances"])
+    assert torch.allclose(statistics["counts"].sum(), weights.sum())
+
+
+@pytest.mark.parametrize("rank", [2, N_DIM])
+def test_low_rank_statistics(points, rank):
+    """Test the low-rank-plus-diagonal class covariances."""
+    points, labels, _ = points
+    statistics = inference.class_statistics(points, labels)
+
+    low_rank = inference.low_rank_class_statistics(points, labels, rank=rank)
+    compressed = inference.low_rank_covariances(statistics["covariances"], rank)
+
+    assert low_rank["factors"].shape == (N_CLASSES, N_DIM, rank)
+    assert torch.allclose(low_rank["means"], statistics["means"])
+    for factorization in (low_rank, compressed):
+        factors = factorization["factors"]
+        covariances = factors @ factors.mT + torch.diag_embed(
+            factorization["diagonals"]
+        )
+        # The variances are kept, and the full rank covariances are exact
+        assert torch.allclose(
+            torch.diagonal(covariances, dim1=-2, dim2=-1),
+            torch.diagonal(statistics["covariances"], dim1=-2, dim2=-1),
+        )
+        if rank == N_DIM:
+            assert torch.allclose(covariances, statistics["covariances"])
+
+
+def test_shared_statistics(points):
+    """Test the pooled within-class covariance."""
+    points, labels, _ = points
+    statistics = inference.class_statistics(points, labels)
+    counts = torch.bincount(labels, minlength=N_CLASSES)
+    pooled = inference.pooled_covariance(statistics["covariances"], counts - 1)
+
+    centered = points - statistics["means"][labels]
+    pooled_ref = centered.T @ centered / (N_POINTS - N_CLASSES)
+    assert torch.allclose(pooled[0], pooled_ref)
+
+    low_rank = inference.low_rank_class_statistics(
+        points, labels, rank=N_DIM, shared=True
+    )
+    factors = low_rank["factors"]
+    assert factors.shape == (1, N_DIM, N_DIM)
+    assert torch.allclose(
+        factors @ factors.mT + torch.diag_embed(low_rank["diagonals"]), pooled
+    )
+
+
+@pytest.mark.parametrize("rank", [2, N_DIM])
+def test_low_rank_statistics_accumulator(points, rank):
+    """Test that low-rank statistics accumulated over batches match the
+    low-rank approximation of the full covariances."""
+    points, labels, weights = points
+    statistics_ref = inference.class_statistics(points, labels, weights=weights)
+    compressed = inference.low_rank_covariances(statistics_ref["covariances"], rank)
+
+    accumulator = inference.ClassStatisticsAccumulator(rank=rank)
+    for start in range(0, N_POINTS, 300):
+        batch = slice(start, start + 300)
+        accumulator.update(points[batch], labels[batch], weights=weights[batch])
+    statistics = accumulator.statistics()
+
+    assert "covariances" not in statistics
+    assert statistics["factors"].shape == (N_CLASSES, N_DIM, rank)
+    assert torch.allclose(statistics["means"], statistics_ref["means"])
+    factors = statistics["factors"]
+    assert torch.allclose(
+        factors @ factors.mT, compressed["factors"] @ compressed["factors"].mT
+    )
+    assert torch.allclose(statistics["diagonals"], compressed["diagonals"])
@@ -10,7 +10,7 @@ import torch
 
 import amatorch.optim as optim
 from amatorch.datasets import disparity_data
-from amatorch.models import AMAGauss
+from amatorch.models import AMAGauss, AMAGaussEnsemble
 
 # Initialize the AMA class
 N_EPOCHS = 10
@@ -56,3 +56,501 @@ def test_training(data):
     assert not torch.isnan(ama.filters.detach()).any(), "Filters are nan"
     assert loss[0] > loss[-1], "Loss did not decrease"
     assert not torch.isnan(posteriors).any(), "Posteriors are nan"
+
+
+def test_training_preprocessed(data, tmp_path):
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    stimuli_processed = optim.preprocess_stimuli(
+        ama, data["stimuli"], filename=tmp_path / "stimuli.dat"
+    )
+    assert torch.allclose(stimuli_processed, ama.preprocess(data["stimuli"]))
+
+    loss, training_time = optim.fit(
+        model=ama,
+        stimuli=stimuli_processed,
+        labels=data["labels"],
+        epochs=N_EPOCHS,
+        batch_size=BATCH_SIZE,
+        learning_rate=LR,
+        decay_step=LR_STEP,
+        decay_rate=LR_GAMMA,
+        preprocessed=True,
+    )
+
+    assert not torch.isnan(ama.filters.detach()).any(), "Filters are nan"
+    assert loss[0] > loss[-1], "Loss did not decrease"
+
+
+def test_training_statistics(data):
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    with torch.no_grad():
+        data_loss_init = optim.kl_loss(ama, data["stimuli"], data["labels"])
+
+    # Fit model without stimuli
+    loss, training_time = optim.fit_statistics(
+        model=ama,
+        steps=100,
+        learning_rate=LR,
+        generator=torch.Generator().manual_seed(0),
+    )
+
+    with torch.no_grad():
+        data_loss = optim.kl_loss(ama, data["stimuli"], data["labels"])
+
+    assert not torch.isnan(ama.filters.detach()).any(), "Filters are nan"
+    assert loss.shape == (100,)
+    assert data_loss < data_loss_init, "Loss on the stimuli did not decrease"
+
+
+def test_tensor_batch_loader(data):
+    loader = optim.TensorBatchLoader(
+        data["stimuli"],
+        torch.arange(data["labels"].shape[0]),
+        batch_size=BATCH_SIZE,
+        reuse_buffers=True,
+    )
+    indices = []
+    for batch_stimuli, batch_indices in loader:
+        assert torch.equal(batch_stimuli, data["stimuli"][batch_indices])
+        # Batches are overwritten by the next one
+        indices.append(batch_indices.clone())
+
+    assert len(indices) == len(loader)
+    assert torch.equal(
+        torch.sort(torch.cat(indices)).values, torch.arange(data["labels"].shape[0])
+    ), "Loader did not visit every sample once"
+    # Only a batch is copied, not the whole tensors
+    assert [buffer.shape[0] for buffer in loader._buffers] == [BATCH_SIZE] * 2
+
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    loss, training_time = optim.fit(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        epochs=N_EPOCHS,
+        batch_size=BATCH_SIZE,
+        learning_rate=LR,
+        decay_step=LR_STEP,
+        decay_rate=LR_GAMMA,
+        loader="tensor",
+    )
+    assert loss[0] > loss[-1], "Loss did not decrease"
+
+
+def test_training_callback(data):
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    reports = []
+    loss, training_time = optim.fit(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        epochs=N_EPOCHS,
+        batch_size=BATCH_SIZE,
+        learning_rate=LR,
+        progress=False,
+        log_interval=4,
+        callback=reports.append,
+    )
+
+    assert [report["epoch"] for report in reports] == [4, 8, N_EPOCHS]
+    assert reports[-1]["loss"] == pytest.approx(loss[-1].item())
+    assert loss.shape == (N_EPOCHS,)
+
+
+def test_training_ensemble(data):
+    """Test that training an ensemble matches training each model separately."""
+    n_models = 3
+    ensemble = AMAGaussEnsemble(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_models=n_models,
+        n_filters=2,
+        response_noise=torch.linspace(0.01, RESPONSE_NOISE, n_models),
+        c50=C50,
+    )
+    models = [ensemble.model(index) for index in range(n_models)]
+    fit_kwargs = {
+        "stimuli": data["stimuli"],
+        "labels": data["labels"],
+        "epochs": 2,
+        "batch_size": BATCH_SIZE,
+        "learning_rate": LR,
+        "loader": "tensor",
+        "progress": False,
+    }
+
+    torch.manual_seed(0)
+    ensemble_loss, _ = optim.fit(model=ensemble, **fit_kwargs)
+    assert ensemble_loss.shape == (2, n_models)
+
+    posteriors = ensemble.posteriors(data["stimuli"])
+    n_stimuli, n_classes = data["stimuli"].shape[0], ensemble.priors.shape[0]
+    assert posteriors.shape == (n_models, n_stimuli, n_classes)
+    estimates = ensemble.batched_inference(
+        data["stimuli"], outputs=("estimates",), batch_size=1000
+    )["estimates"]
+    assert torch.equal(estimates, torch.argmax(posteriors, dim=-1))
+
+    for index, model in enumerate(models):
+        torch.manual_seed(0)
+        loss, _ = optim.fit(model=model, **fit_kwargs)
+        assert torch.allclose(ensemble_loss[:, index], loss, atol=1e-5)
+        assert torch.allclose(ensemble.filters[index], model.filters, atol=1e-5)
+
+
+def test_training_incremental(data):
+    """Test that incremental training only trains the filters of each stage."""
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    loss, _ = optim.fit_incremental(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_stages=2,
+        filters_per_stage=2,
+        epochs=2,
+        batch_size=BATCH_SIZE,
+        loader="tensor",
+        progress=False,
+    )
+    first_stage_filters = ama.fixed_filters.clone()
+
+    optim.fit(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        epochs=1,
+        loader="tensor",
+        progress=False,
+    )
+
+    assert loss.shape == (4,)
+    assert ama.n_filters == 4
+    assert ama.all_filters.shape == (4, *data["stimuli"].shape[1:])
+    # Only the filters of the last stage are trainable
+    assert ama.filters.shape == (2, *data["stimuli"].shape[1:])
+    assert torch.equal(ama.fixed_filters, first_stage_filters)
+
+    # The block-wise response statistics match those of all the filters
+    ama_full = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=4,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    ama_full.filters = ama.all_filters.detach()
+    for name in ("means", "covariances"):
+        assert torch.allclose(
+            ama.response_statistics[name],
+            ama_full.response_statistics[name],
+            atol=1e-6,
+        )
+
+
+def test_training_lbfgs(data):
+    """Test full-batch L-BFGS training and its early stopping."""
+    torch.manual_seed(0)
+    ama = AMAGauss(
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    initial_filters = ama.parametrizations.filters.original.detach().clone()
+
+    loss, training_time = optim.fit_lbfgs(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        max_iterations=10,
+        batch_size=4000,
+        progress=False,
+    )
+
+    assert loss.shape == training_time.shape
+    assert loss[0] > loss[-1], "Loss did not decrease"
+    filter_norms = torch.linalg.vector_norm(
+        ama.parametrizations.filters.original, dim=(-2, -1)
+    )
+    assert torch.allclose(filter_norms, torch.ones(2))
+
+    # A large tolerance stops training after the second iteration
+    ama.filters = initial_filters
+    loss_stopped, _ = optim.fit_lbfgs(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        max_iterations=10,
+        tolerance=10.0,
+        progress=False,
+    )
+    assert len(loss_stopped) == 2
+    assert torch.isclose(loss_stopped[0], loss[0])
+
+    # Ensembles would share the line search, so they are rejected
+    ensemble = AMAGaussEnsemble(
+        stimuli=data["stimuli"], labels=data["labels"], n_models=2, n_filters=2
+    )
+    with pytest.raises(ValueError):
+        optim.fit_lbfgs(ensemble, data["stimuli"], data["labels"], progress=False)
+
+
+def test_training_checkpoint(data, tmp_path):
+    """Test that resuming from a checkpoint matches an uninterrupted fit."""
+    fit_kwargs = {
+        "stimuli": data["stimuli"],
+        "labels": data["labels"],
+        "batch_size": BATCH_SIZE,
+        "learning_rate": LR,
+        "decay_step": 1,
+        "decay_rate": LR_GAMMA,
+        "loader": "tensor",
+        "progress": False,
+    }
+    checkpoint_path = tmp_path / "checkpoint.pt"
+
+    torch.manual_seed(0)
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    initial_filters = ama.parametrizations.filters.original.detach().clone()
+    loss, _ = optim.fit(model=ama, epochs=4, **fit_kwargs)
+
+    # Interrupted after 2 epochs, then resumed in a new model
+    torch.manual_seed(0)
+    ama_interrupted = AMAGauss(
+        stimuli=data["stimuli"], labels=data["labels"], n_filters=2
+    )
+    ama_interrupted.filters = initial_filters
+    optim.fit(
+        model=ama_interrupted,
+        epochs=2,
+        checkpoint_path=checkpoint_path,
+        **fit_kwargs,
+    )
+    ama_resumed = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    loss_resumed, training_time = optim.fit(
+        model=ama_resumed,
+        epochs=4,
+        checkpoint_path=checkpoint_path,
+        resume=True,
+        **fit_kwargs,
+    )
+
+    assert training_time.shape == (4,)
+    assert torch.allclose(loss_resumed, loss)
+    assert torch.allclose(ama_resumed.filters, ama.filters)
+
+
+def test_training_early_stopping(data):
+    """Test that training stops when the loss stops changing."""
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    loss, training_time = optim.fit(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        epochs=N_EPOCHS,
+        batch_size=BATCH_SIZE,
+        loader="tensor",
+        progress=False,
+        tolerance=10.0,
+        patience=2,
+    )
+    assert loss.shape == training_time.shape == (3,)
+
+
+def test_training_early_stopping_checkpoint(data, tmp_path):
+    """Test that resuming keeps the early stopping state of the checkpoint."""
+    fit_kwargs = {
+        "stimuli": data["stimuli"],
+        "labels": data["labels"],
+        "batch_size": BATCH_SIZE,
+        "loader": "tensor",
+        "progress": False,
+        "tolerance": 10.0,
+        "patience": 2,
+        "checkpoint_path": tmp_path / "checkpoint.pt",
+    }
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+
+    # Interrupted after one stalled epoch, then resumed
+    optim.fit(model=ama, epochs=2, **fit_kwargs)
+    loss, _ = optim.fit(model=ama, epochs=N_EPOCHS, resume=True, **fit_kwargs)
+    assert loss.shape == (3,)
+
+    # Resuming a run that stopped early returns its results
+    filters = ama.filters.detach().clone()
+    loss_resumed, training_time = optim.fit(
+        model=ama, epochs=N_EPOCHS, resume=True, **fit_kwargs
+    )
+    assert torch.equal(loss_resumed, loss)
+    assert training_time.shape == (3,)
+    assert torch.equal(ama.filters, filters)
+
+
+def test_training_coarse_to_fine(data):
+    """Test that coarse-to-fine training warm starts each level."""
+    stimuli = data["stimuli"]
+    coarse_filters = torch.randn(2, stimuli.shape[1], -(-stimuli.shape[2] // 2))
+    # Upsampled filters have the same norm and responses
+    assert torch.allclose(
+        torch.einsum("kcd,ncd->nk", coarse_filters, optim._downsample(stimuli, 2)),
+        torch.einsum("kcd,ncd->nk", optim._upsample(coarse_filters, 2), stimuli),
+        atol=1e-5,
+    )
+
+    ama = AMAGauss(
+        stimuli=stimuli,
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+    )
+    loss, training_time = optim.fit_coarse_to_fine(
+        model=ama,
+        stimuli=stimuli,
+        labels=data["labels"],
+        n_levels=3,
+        epochs=2,
+        batch_size=BATCH_SIZE,
+        loader="tensor",
+        progress=False,
+    )
+    assert loss.shape == (6,)
+    assert training_time.shape == (6,)
+    assert ama.filters.shape == (2, *stimuli.shape[1:])
+    assert loss[-1] < loss[0]
+
+
+def test_training_coarse_to_fine_settings(data, monkeypatch):
+    """Test that the coarse levels keep the settings of the model."""
+    stimuli = data["stimuli"]
+    ama = AMAGauss(
+        stimuli=stimuli,
+        labels=data["labels"],
+        n_filters=2,
+        response_noise=RESPONSE_NOISE,
+        c50=C50,
+        covariance_rank=3,
+        shared_covariance=True,
+        n_components=8,
+        whiten=True,
+        statistics_dtype=torch.float64,
+    )
+    level_models = []
+    fit = optim.fit
+
+    def record_fit(model, *args, **kwargs):
+        level_models.append(model)
+        return fit(model, *args, **kwargs)
+
+    monkeypatch.setattr(optim, "fit", record_fit)
+    loss, _ = optim.fit_coarse_to_fine(
+        model=ama,
+        stimuli=stimuli,
+        labels=data["labels"],
+        n_levels=2,
+        epochs=1,
+        batch_size=BATCH_SIZE,
+        loader="tensor",
+        progress=False,
+    )
+
+    assert loss.shape == (2,)
+    coarse = level_models[0]
+    assert coarse.whiten
+    assert coarse.components.shape[-1] == 8
+    assert coarse.filters.dtype == torch.float32
+    assert coarse.stimulus_statistics["factors"].shape == (1, 8, 3)
+    assert coarse.stimulus_statistics["factors"].dtype == torch.float64
+    assert ama.filters.shape == (2, 1, 8)
+
+
+def test_training_zero_epochs(data):
+    """Test that training for zero epochs returns empty losses."""
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    fits = [
+        optim.fit(ama, data["stimuli"], data["labels"], epochs=0, progress=False),
+        optim.fit_statistics(ama, steps=0, progress=False),
+        optim.fit_lbfgs(
+            ama, data["stimuli"], data["labels"], max_iterations=0, progress=False
+        ),
+    ]
+    for loss, training_time in fits:
+        assert loss.shape == training_time.shape == (0,)
+
+
+def test_training_loss_change(data):
+    """Test that the reported change is between consecutive epochs."""
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    reports = []
+    loss, _ = optim.fit(
+        model=ama,
+        stimuli=data["stimuli"],
+        labels=data["labels"],
+        epochs=4,
+        batch_size=BATCH_SIZE,
+        loader="tensor",
+        progress=False,
+        log_interval=2,
+        callback=reports.append,
+    )
+    assert [report["epoch"] for report in reports] == [2, 4]
+    for report in reports:
+        epoch = report["epoch"]
+        change = (loss[epoch - 1] - loss[epoch - 2]).item()
+        assert report["loss_change"] == pytest.approx(change, abs=1e-6)
+
+
+def test_fixed_filters_state_dict(data):
+    """Test loading state dicts with and without fixed filters."""
+    ama = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    ama.add_filters(2)
+
+    # Saved after `add_filters`, loaded in a new model
+    ama_loaded = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    ama_loaded.load_state_dict(ama.state_dict())
+    assert ama_loaded.n_filters == 4
+    assert torch.equal(ama_loaded.all_filters, ama.all_filters)
+    assert torch.allclose(
+        ama_loaded.log_likelihoods(data["stimuli"]),
+        ama.log_likelihoods(data["stimuli"]),
+    )
+
+    # Saved before fixed filters existed
+    state_dict = ama_loaded.state_dict()
+    del state_dict["fixed_filters"]
+    ama_old = AMAGauss(stimuli=data["stimuli"], labels=data["labels"], n_filters=2)
+    ama_old.load_state_dict(state_dict)
+    assert ama_old.n_filters == 2
+    assert ama_old.fixed_filters.shape == (0, *data["stimuli"].shape[1:])
+    assert torch.equal(ama_old.filters, ama_loaded.filters)